@@ -0,0 +1,212 @@
+# artifact_store.py
+# Large tool payloads (metric series, log batches) are stored once here, keyed by a hash of their content.
+# Chat messages and the LLM conversation history keep only an ArtifactRef and load the payload on demand,
+# so per-session memory stays flat however many large results a session fetches.
+
+import collections
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from typing import NamedTuple
+
+import compact_data
+import config
+import telemetry
+
+
+class ArtifactRef(NamedTuple):
+    artifact_id: str
+    size_bytes: int
+
+
+_SPILL_FILE_NAME = re.compile(r"[0-9a-f]{64}\.json")
+
+def _serialize(payload) -> bytes:
+    return json.dumps(payload, default=compact_data.json_default, separators=(",", ":")).encode("utf-8")
+
+
+class ArtifactStore:
+    """
+    Content-addressed payload store: an in-memory LRU bounded by serialized size, spilling evicted
+    payloads to `spill_dir` (itself bounded, oldest files removed first). Identical payloads share
+    one entry. Payloads handed out by `get` are shared and must be treated as read-only.
+    Disk I/O happens outside the store lock; spilled files are checked against their content hash on load.
+    `spill_dir=None` uses a private (0700) temporary directory created on the first spill.
+    """
+
+    def __init__(self, max_memory_bytes, spill_dir, max_disk_bytes):
+        self.max_memory_bytes = max_memory_bytes
+        self.spill_dir = spill_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = collections.OrderedDict()  # artifact_id -> (payload, size_bytes)
+        self._spilling = {}  # artifact_id -> payload, evicted from memory but not written yet
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()  # Serializes spill-directory changes; never held with _lock
+
+    def put(self, payload, data: bytes = None) -> ArtifactRef:
+        """Stores `payload` (whose serialized form is `data`, if the caller already has it)."""
+        data = _serialize(payload) if data is None else data
+        artifact_id = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if artifact_id in self._entries:
+                self._entries.move_to_end(artifact_id)
+                victims = []
+            else:
+                self._entries[artifact_id] = (payload, len(data))
+                self._memory_bytes += len(data)
+                victims = self._evict_locked()
+        self._spill_all(victims)
+        return ArtifactRef(artifact_id, len(data))
+
+    def get(self, ref: ArtifactRef):
+        """The payload behind `ref`, or None if it has been evicted from memory and disk."""
+        with self._lock:
+            entry = self._entries.get(ref.artifact_id)
+            if entry is not None:
+                self._entries.move_to_end(ref.artifact_id)
+            elif ref.artifact_id in self._spilling:
+                entry = (self._spilling[ref.artifact_id], ref.size_bytes)
+        if entry is not None:
+            telemetry.increment("sre_agent_artifact_loads_total", "Artifact loads by where they were found.", source="memory")
+            return entry[0]
+        payload = self._load(ref.artifact_id)
+        if payload is None:
+            telemetry.increment("sre_agent_artifact_loads_total", "Artifact loads by where they were found.", source="missing")
+            return None
+        telemetry.increment("sre_agent_artifact_loads_total", "Artifact loads by where they were found.", source="disk")
+        with self._lock:
+            victims = []
+            if ref.artifact_id not in self._entries:
+                self._entries[ref.artifact_id] = (payload, ref.size_bytes)
+                self._memory_bytes += ref.size_bytes
+                victims = self._evict_locked()
+        self._spill_all(victims)
+        return payload
+
+    def clear(self):
+        """Drops every artifact, in memory and on disk."""
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
+        with self._disk_lock:
+            if self.spill_dir is None or not os.path.isdir(self.spill_dir):
+                return
+            for entry in self._spill_files():
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+    @property
+    def memory_bytes(self):
+        return self._memory_bytes
+
+    def _spill_path(self, artifact_id):
+        return os.path.join(self.spill_dir, f"{artifact_id}.json")
+
+    def _spill_files(self):
+        """This store's spill files (`<sha256>.json` regular files); anything else in the directory is left alone."""
+        with os.scandir(self.spill_dir) as entries:
+            return [entry for entry in entries
+                    if _SPILL_FILE_NAME.fullmatch(entry.name) and entry.is_file(follow_symlinks=False)]
+
+    def _load(self, artifact_id):
+        if self.spill_dir is None:
+            return None
+        try:
+            with open(self._spill_path(artifact_id), "rb") as spilled:
+                data = spilled.read()
+        except OSError:
+            return None
+        if hashlib.sha256(data).hexdigest() != artifact_id:
+            print(f"ARTIFACT_STORE: Spilled artifact {artifact_id[:12]} doesn't match its content hash; ignoring it.")
+            return None
+        try:
+            return compact_data.from_json(json.loads(data))
+        except ValueError:
+            return None
+
+    def _evict_locked(self):
+        """Removes least recently used entries until the budget holds; returns them for `_spill_all`."""
+        victims = []
+        # The newest entry always stays in memory, even if it alone exceeds the budget.
+        while self._memory_bytes > self.max_memory_bytes and len(self._entries) > 1:
+            artifact_id, (payload, size_bytes) = self._entries.popitem(last=False)
+            self._memory_bytes -= size_bytes
+            self._spilling[artifact_id] = payload
+            victims.append((artifact_id, payload))
+        return victims
+
+    def _spill_all(self, victims):
+        for artifact_id, payload in victims:
+            self._spill(artifact_id, payload)
+            with self._lock:
+                self._spilling.pop(artifact_id, None)
+
+    def _ensure_spill_dir(self):
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix="sre-agent-artifacts-")  # Created with mode 0700
+        else:
+            os.makedirs(self.spill_dir, mode=0o700, exist_ok=True)
+
+    def _spill(self, artifact_id, payload):
+        try:
+            with self._disk_lock:
+                self._ensure_spill_dir()
+                path = self._spill_path(artifact_id)
+                if not os.path.exists(path):
+                    with open(path, "wb") as spilled:
+                        spilled.write(_serialize(payload))
+                    self._trim_disk()
+        except OSError as e:
+            print(f"ARTIFACT_STORE: Could not spill artifact {artifact_id[:12]} to disk: {e}")
+
+    def _trim_disk(self):
+        files = []
+        for entry in self._spill_files():
+            stat = entry.stat(follow_symlinks=False)
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+
+# One store per server process, shared by all sessions (identical payloads are stored once).
+store = ArtifactStore(config.ARTIFACT_STORE_MAX_MEMORY_BYTES, config.ARTIFACT_STORE_DIR,
+                      config.ARTIFACT_STORE_MAX_DISK_BYTES)
+
+def offload(payload):
+    """An ArtifactRef for payloads of at least ARTIFACT_INLINE_MAX_BYTES; small payloads are returned as is."""
+    if payload is None or isinstance(payload, ArtifactRef):
+        return payload
+    data = _serialize(payload)
+    if len(data) < config.ARTIFACT_INLINE_MAX_BYTES:
+        return payload
+    return store.put(payload, data)
+
+def resolve(value):
+    """The payload behind an ArtifactRef (None if it expired); any other value is returned unchanged."""
+    if isinstance(value, ArtifactRef):
+        return store.get(value)
+    return value
+
+def compact_tool_content(content: str, ref=None) -> str:
+    """
+    Tool message content for the conversation history: short content is kept as is; long content is cut
+    to a preview that points at the stored artifact (`ref`) holding the full tool output.
+    """
+    if len(content) <= config.ARTIFACT_HISTORY_PREVIEW_CHARS:
+        return content
+    compacted = {"truncated_preview": content[:config.ARTIFACT_HISTORY_PREVIEW_CHARS],
+                 "note": "Earlier tool output, truncated. Call the tool again if the full data is needed."}
+    if isinstance(ref, ArtifactRef):
+        compacted["artifact_id"] = ref.artifact_id
+        compacted["size_bytes"] = ref.size_bytes
+    return json.dumps(compacted)
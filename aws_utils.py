@@ -1,23 +1,38 @@
 # aws_utils.py
-import boto3
 import datetime
+import re
 import time
-from botocore.exceptions import ClientError
+from array import array
 import config 
+import telemetry
+import compact_data
+import deadline
 
 _cloudwatch_client = None
 _logs_client = None
 
+# boto3/botocore are imported on first use: they are only needed when real AWS calls are made,
+# and loading them costs noticeably at startup.
+
+def _client_config():
+    # Bound each HTTP attempt (and the number of retries) so a single slow CloudWatch call can't
+    # exceed the backend timeout by much; the turn deadline then caps the overall wait.
+    from botocore.config import Config
+    return Config(connect_timeout=5, read_timeout=config.BACKEND_TIMEOUT_SECONDS,
+                  retries={'max_attempts': 2, 'mode': 'standard'})
+
 def get_cloudwatch_client():
     global _cloudwatch_client
     if _cloudwatch_client is None:
-        _cloudwatch_client = boto3.client('cloudwatch', region_name=config.AWS_REGION)
+        import boto3
+        _cloudwatch_client = boto3.client('cloudwatch', region_name=config.AWS_REGION, config=_client_config())
     return _cloudwatch_client
 
 def get_logs_client():
     global _logs_client
     if _logs_client is None:
-        _logs_client = boto3.client('logs', region_name=config.AWS_REGION)
+        import boto3
+        _logs_client = boto3.client('logs', region_name=config.AWS_REGION, config=_client_config())
     return _logs_client
 
 def get_metric_data_from_cw(namespace, metric_name, dimensions, start_time, end_time, period, statistic):
@@ -25,41 +40,167 @@ def get_metric_data_from_cw(namespace, metric_name, dimensions, start_time, end_
     Fetches metric data from AWS CloudWatch.
     Dimensions example: [{'Name': 'InstanceId', 'Value': 'i-12345'}]
     """
+    from botocore.exceptions import ClientError
+    client = get_cloudwatch_client()
+    try:
+        with telemetry.span("aws", "cloudwatch.get_metric_data", metric_name=metric_name):
+            response = deadline.hedged_call(
+                "cloudwatch.get_metric_data", client.get_metric_data,
+                MetricDataQueries=[
+                    {
+                        'Id': 'm1',
+                        'MetricStat': {
+                            'Metric': {
+                                'Namespace': namespace,
+                                'MetricName': metric_name,
+                                'Dimensions': dimensions
+                            },
+                            'Period': period,
+                            'Stat': statistic,
+                        },
+                        'ReturnData': True,
+                    },
+                ],
+                StartTime=start_time, 
+                EndTime=end_time,
+                ScanBy='TimestampAscending'
+            )
+        if response['MetricDataResults'] and response['MetricDataResults'][0]['Timestamps']:
+            label = f"{metric_name} ({statistic})"
+            return compact_data.MetricResult([compact_data.MetricSeries(
+                label, response['MetricDataResults'][0]['Timestamps'], response['MetricDataResults'][0]['Values'])], label)
+        label = f"{metric_name} ({statistic}) - No data"
+        return compact_data.MetricResult([compact_data.MetricSeries(label)], label)
+    except ClientError as e:
+        print(f"Error fetching metric data from CloudWatch for {metric_name}: {e}")
+        return {"error": str(e), "metric_name": metric_name}
+
+_STAT_SUFFIX_RE = re.compile(r"^(.+)_(Average|Sum|Minimum|Maximum|SampleCount|p\d{1,2}(?:\.\d+)?)$")
+_IDENTIFIER_RE = re.compile(r"[A-Za-z][A-Za-z0-9_]*")
+_STATISTIC_RE = re.compile(r"^(Average|Sum|Minimum|Maximum|SampleCount|p\d{1,2}(?:\.\d+)?)$")
+
+def split_metric_reference(identifier, default_statistic):
+    """'Errors_Sum' -> ('Errors', 'Sum'); 'Errors' -> ('Errors', default_statistic)."""
+    suffix_match = _STAT_SUFFIX_RE.match(identifier)
+    if suffix_match:
+        return suffix_match.group(1), suffix_match.group(2)
+    return identifier, default_statistic
+
+def get_metric_statistics_from_cw(namespace, metric_name, dimensions, start_time, end_time, period,
+                                  statistics, expressions=None):
+    """
+    Fetches several statistics (incl. percentiles like 'p99') of one metric plus metric-math expressions
+    in a single GetMetricData request, so CloudWatch does the aggregation and the math server-side.
+    Expressions are "Label=expression" (or just "expression") and refer to metrics by name, optionally
+    with a statistic suffix: "ErrorRate=100*Errors_Sum/Invocations_Sum". A bare name uses the first statistic.
+    Returns a multi-series compact_data.MetricResult or {"error": ...}.
+    """
+    from botocore.exceptions import ClientError
+    expressions = expressions or []
+    for statistic in statistics:
+        if not _STATISTIC_RE.match(statistic):
+            return {"error": f"Unsupported statistic '{statistic}'. Use Average, Sum, Minimum, Maximum, SampleCount or a percentile like 'p99'."}
+
+    queries = []
+    query_ids = {}  # (metric, statistic) -> query id
+
+    def _metric_query_id(name, statistic, return_data, label=None):
+        if (name, statistic) not in query_ids:
+            query_id = f"m{len(query_ids)}"
+            query_ids[(name, statistic)] = query_id
+            queries.append({
+                'Id': query_id,
+                'MetricStat': {
+                    'Metric': {'Namespace': namespace, 'MetricName': name, 'Dimensions': dimensions},
+                    'Period': period,
+                    'Stat': statistic,
+                },
+                'Label': label or f"{name} ({statistic})",
+                'ReturnData': return_data,
+            })
+        elif return_data:
+            next(q for q in queries if q['Id'] == query_ids[(name, statistic)])['ReturnData'] = True
+        return query_ids[(name, statistic)]
+
+    for statistic in statistics:
+        _metric_query_id(metric_name, statistic, True)
+    for i, expression in enumerate(expressions):
+        label, _, body = expression.partition("=") if "=" in expression else (expression, "", expression)
+        body = body.strip()
+
+        def _to_query_id(match):
+            identifier = match.group(0)
+            # Identifiers followed by "(" are metric-math functions (e.g. ABS, FILL, RATE), not metrics.
+            if body[match.end():].lstrip().startswith("("):
+                return identifier
+            return _metric_query_id(*split_metric_reference(identifier, statistics[0]), return_data=False)
+
+        queries.append({'Id': f"e{i}", 'Expression': _IDENTIFIER_RE.sub(_to_query_id, body),
+                        'Label': label.strip(), 'ReturnData': True})
+
+    client = get_cloudwatch_client()
+    series_by_id = {q['Id']: compact_data.MetricSeries(q['Label']) for q in queries if q['ReturnData']}
+    request = {'MetricDataQueries': queries, 'StartTime': start_time, 'EndTime': end_time, 'ScanBy': 'TimestampAscending'}
+    try:
+        while True:
+            with telemetry.span("aws", "cloudwatch.get_metric_data", metric_name=metric_name, queries=len(queries)):
+                response = deadline.hedged_call("cloudwatch.get_metric_data", client.get_metric_data, **request)
+            for result in response.get('MetricDataResults', []):
+                if result['Id'] in series_by_id:
+                    series_by_id[result['Id']].extend(result.get('Timestamps', []), result.get('Values', []))
+            if not response.get('NextToken'):
+                break
+            request['NextToken'] = response['NextToken']
+        return compact_data.MetricResult(series_by_id.values(), metric_name, multi_series=True)
+    except ClientError as e:
+        print(f"Error fetching metric statistics from CloudWatch for {metric_name}: {e}")
+        return {"error": str(e), "metric_name": metric_name}
+
+_MAX_QUERIES_PER_GET_METRIC_DATA = 500 # CloudWatch limit on MetricDataQueries per request
+
+def get_fleet_metric_data_from_cw(series_specs, metric_name, start_time, end_time, period, statistic):
+    """
+    Fetches one metric for many resources with as few GetMetricData requests as possible
+    (up to 500 queries per request, following NextToken pages).
+    series_specs: [{"key": <caller's label>, "namespace": ..., "dimensions": [...]}, ...]
+    Returns {"series": {key: array of float values in timestamp order}} or {"error": ...}.
+    """
+    from botocore.exceptions import ClientError
     client = get_cloudwatch_client()
+    values_by_key = {spec["key"]: array("d") for spec in series_specs}
     try:
-        response = client.get_metric_data(
-            MetricDataQueries=[
+        for chunk_start in range(0, len(series_specs), _MAX_QUERIES_PER_GET_METRIC_DATA):
+            chunk = series_specs[chunk_start:chunk_start + _MAX_QUERIES_PER_GET_METRIC_DATA]
+            query_id_to_key = {f"m{chunk_start + i}": spec["key"] for i, spec in enumerate(chunk)}
+            queries = [
                 {
-                    'Id': 'm1',
+                    'Id': f"m{chunk_start + i}",
                     'MetricStat': {
-                        'Metric': {
-                            'Namespace': namespace,
-                            'MetricName': metric_name,
-                            'Dimensions': dimensions
-                        },
+                        'Metric': {'Namespace': spec["namespace"], 'MetricName': metric_name, 'Dimensions': spec["dimensions"]},
                         'Period': period,
                         'Stat': statistic,
                     },
                     'ReturnData': True,
-                },
-            ],
-            StartTime=start_time, 
-            EndTime=end_time,
-            ScanBy='TimestampAscending'
-        )
-        if response['MetricDataResults'] and response['MetricDataResults'][0]['Timestamps']:
-            timestamps_iso = [ts.isoformat() for ts in response['MetricDataResults'][0]['Timestamps']]
-            return {
-                "Timestamps": timestamps_iso,
-                "Values": response['MetricDataResults'][0]['Values'],
-                "Label": f"{metric_name} ({statistic})"
-            }
-        return {"Timestamps": [], "Values": [], "Label": f"{metric_name} ({statistic}) - No data"}
+                }
+                for i, spec in enumerate(chunk)
+            ]
+            request = {'MetricDataQueries': queries, 'StartTime': start_time, 'EndTime': end_time,
+                       'ScanBy': 'TimestampAscending'}
+            while True:
+                with telemetry.span("aws", "cloudwatch.get_metric_data", metric_name=metric_name, queries=len(queries)):
+                    response = deadline.hedged_call("cloudwatch.get_metric_data", client.get_metric_data, **request)
+                for result in response.get('MetricDataResults', []):
+                    values_by_key[query_id_to_key[result['Id']]].extend(result.get('Values', []))
+                if not response.get('NextToken'):
+                    break
+                request['NextToken'] = response['NextToken']
+        return {"series": values_by_key}
     except ClientError as e:
-        print(f"Error fetching metric data from CloudWatch for {metric_name}: {e}")
+        print(f"Error fetching fleet metric data from CloudWatch for {metric_name}: {e}")
         return {"error": str(e), "metric_name": metric_name}
 
 def get_logs_from_cw(log_group_name, start_time_epoch_ms, end_time_epoch_ms, filter_pattern="", limit=50):
+    from botocore.exceptions import ClientError
     client = get_logs_client()
     try:
         params = {
@@ -72,8 +213,10 @@ def get_logs_from_cw(log_group_name, start_time_epoch_ms, end_time_epoch_ms, fil
         if filter_pattern:
             params['filterPattern'] = filter_pattern
         
-        response = client.filter_log_events(**params)
-        return {"events": response.get('events', [])}
+        with telemetry.span("aws", "logs.filter_log_events", log_group_name=log_group_name):
+            response = deadline.hedged_call("logs.filter_log_events", client.filter_log_events, **params)
+        # filter_log_events returns a nextToken whenever it stopped before the end of the range.
+        return compact_data.LogBatch(response.get('events', []), complete=not response.get('nextToken'))
     except ClientError as e:
         print(f"Error fetching logs from CloudWatch for {log_group_name}: {e}")
         if e.response['Error']['Code'] == 'ResourceNotFoundException':
@@ -142,6 +285,8 @@ def get_cw_params_for_service(service_name_from_user, metric_name_or_log_type):
         }
 
 
+_RELATIVE_RANGE_RE = re.compile(r"(?:last|past)\s+(\d+)\s+(minute|hour|day|week)s?\b")
+
 def parse_time_range(time_range_str: str, current_time_utc=None):
     """
     Parses simple natural language time ranges to start_time, end_time (UTC datetime objects).
@@ -165,13 +310,19 @@ def parse_time_range(time_range_str: str, current_time_utc=None):
         start_time = end_time - datetime.timedelta(hours=6)
     elif "last 12 hours" in time_range_str_lower:
         start_time = end_time - datetime.timedelta(hours=12)
-    elif "last 24 hours" in time_range_str_lower or "past day" in time_range_str_lower:
+    elif "last 24 hours" in time_range_str_lower or "past day" in time_range_str_lower or "last day" in time_range_str_lower:
         start_time = end_time - datetime.timedelta(days=1)
     elif "today" in time_range_str_lower: # Assumes "today" means since midnight UTC of the current_time_utc
         start_time = current_time_utc.replace(hour=0, minute=0, second=0, microsecond=0)
     elif "yesterday" in time_range_str_lower:
         end_time = current_time_utc.replace(hour=0, minute=0, second=0, microsecond=0)
         start_time = end_time - datetime.timedelta(days=1)
+    elif "last week" in time_range_str_lower or "past week" in time_range_str_lower:
+        start_time = end_time - datetime.timedelta(days=7)
+    elif _RELATIVE_RANGE_RE.search(time_range_str_lower):
+        match = _RELATIVE_RANGE_RE.search(time_range_str_lower)
+        unit = match.group(2)
+        start_time = end_time - datetime.timedelta(**{f"{unit}s": int(match.group(1))})
     # Add more complex parsing here if needed (e.g., "from 9 AM to 5 PM UTC yesterday")
     else: # Default to last 1 hour if not parseable by simple rules
         print(f"Warning: Could not parse time_range_str '{time_range_str}'. Defaulting to last 1 hour.")
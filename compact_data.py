@@ -0,0 +1,210 @@
+# compact_data.py
+# Array-backed containers for metric series and log events. Tool results are kept in these inside the
+# process; they are turned into the original JSON shapes only where data leaves it (LLM messages, cache
+# keys, the artifact spill files and the debug view), via `to_json` / `json_default`.
+
+import bisect
+import datetime
+import math
+import sys
+from array import array
+
+_NAN = float("nan")
+
+
+def _epoch_seconds(timestamp) -> int:
+    """Epoch seconds from a datetime, an ISO-8601 string (naive means UTC) or a number."""
+    if isinstance(timestamp, (int, float)):
+        return int(timestamp)
+    if isinstance(timestamp, str):
+        timestamp = datetime.datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+    return int(timestamp.timestamp())
+
+def _iso(epoch_seconds: int) -> str:
+    return datetime.datetime.fromtimestamp(epoch_seconds, tz=datetime.timezone.utc).isoformat()
+
+
+class MetricSeries:
+    """One labelled series: int64 epoch-second timestamps and float64 values (NaN for missing points)."""
+    __slots__ = ("label", "timestamps", "values")
+
+    def __init__(self, label="", timestamps=(), values=()):
+        self.label = label
+        self.timestamps = timestamps if isinstance(timestamps, array) else array("q", map(_epoch_seconds, timestamps))
+        self.values = values if isinstance(values, array) else array("d", (_NAN if v is None else float(v) for v in values))
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def extend(self, timestamps, values):
+        self.timestamps.extend(array("q", map(_epoch_seconds, timestamps)) if not isinstance(timestamps, array) else timestamps)
+        self.values.extend(array("d", (_NAN if v is None else float(v) for v in values)) if not isinstance(values, array) else values)
+
+    def copy(self):
+        return MetricSeries(self.label, array("q", self.timestamps), array("d", self.values))
+
+    def after(self, epoch_seconds):
+        """The points strictly later than `epoch_seconds`, as a new series."""
+        start = bisect.bisect_right(self.timestamps, epoch_seconds)
+        return MetricSeries(self.label, self.timestamps[start:], self.values[start:])
+
+    def iso_timestamps(self):
+        return [_iso(ts) for ts in self.timestamps]
+
+    def values_list(self):
+        """Values with missing points as None (JSON-safe)."""
+        return [None if math.isnan(v) else v for v in self.values]
+
+    def numeric_values(self):
+        return [v for v in self.values if not math.isnan(v)]
+
+    def to_json(self):
+        return {"Timestamps": self.iso_timestamps(), "Values": self.values_list(), "Label": self.label}
+
+
+class MetricResult:
+    """
+    A metric tool result. A plain single-statistic result has one series and serializes to
+    {"Timestamps", "Values", "Label"}; multi-statistic / metric-math results serialize to {"Series": [...], "Label"}.
+    """
+    __slots__ = ("series", "label", "multi_series", "attributes")
+
+    def __init__(self, series, label="", multi_series=False, attributes=None):
+        self.series = list(series)
+        self.label = label
+        self.multi_series = multi_series
+        self.attributes = attributes or {}  # Other top-level keys of the original shape, e.g. "Service"
+
+    def with_series(self, series):
+        return MetricResult(series, self.label, self.multi_series, self.attributes)
+
+    def copy(self):
+        return self.with_series([s.copy() for s in self.series])
+
+    def to_json(self):
+        if self.multi_series:
+            data = {"Series": [s.to_json() for s in self.series], "Label": self.label}
+        else:
+            data = self.series[0].to_json() if self.series else {"Timestamps": [], "Values": [], "Label": self.label}
+        data.update(self.attributes)
+        return data
+
+    @classmethod
+    def from_json(cls, data):
+        attributes = {k: v for k, v in data.items() if k not in ("Series", "Timestamps", "Values", "Label")}
+        if "Series" in data:
+            series = [MetricSeries(s.get("Label", ""), s.get("Timestamps", []), s.get("Values", [])) for s in data["Series"]]
+            return cls(series, data.get("Label", ""), True, attributes)
+        series = MetricSeries(data.get("Label", ""), data.get("Timestamps", []), data.get("Values", []))
+        return cls([series], series.label, False, attributes)
+
+
+class LogBatch:
+    """
+    Log events stored column-wise: millisecond timestamps in arrays, each stream name stored once
+    (interned) and referenced by index, event IDs only kept once a source provides them.
+    `complete` is False when the backend said more events exist than were returned, None if unknown.
+    """
+    __slots__ = ("timestamps", "ingestion_times", "stream_ids", "streams", "_stream_index", "messages", "event_ids", "complete")
+
+    def __init__(self, events=(), complete=None):
+        self.timestamps = array("q")
+        self.ingestion_times = array("q")
+        self.stream_ids = array("I")
+        self.streams = []
+        self._stream_index = {}
+        self.messages = []
+        self.event_ids = None
+        self.complete = complete
+        for event in events:
+            self.append(event.get("timestamp", 0), event.get("logStreamName", ""), event.get("message", ""),
+                        event.get("eventId"), event.get("ingestionTime", 0))
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def append(self, timestamp, stream, message, event_id=None, ingestion_time=0):
+        stream_id = self._stream_index.get(stream)
+        if stream_id is None:
+            stream_id = self._stream_index[stream] = len(self.streams)
+            self.streams.append(sys.intern(stream))
+        if event_id is not None and self.event_ids is None:
+            self.event_ids = [None] * len(self.timestamps)
+        self.timestamps.append(int(timestamp))
+        self.ingestion_times.append(int(ingestion_time or 0))
+        self.stream_ids.append(stream_id)
+        self.messages.append(message)
+        if self.event_ids is not None:
+            self.event_ids.append(event_id)
+
+    def append_from(self, other, i):
+        self.append(other.timestamps[i], other.stream_name(i), other.messages[i],
+                    other.event_ids[i] if other.event_ids is not None else None, other.ingestion_times[i])
+
+    def stream_name(self, i):
+        return self.streams[self.stream_ids[i]]
+
+    def key(self, i):
+        """Identity of event i: CloudWatch's eventId, or its content for sources without one (the mock API)."""
+        if self.event_ids is not None and self.event_ids[i] is not None:
+            return self.event_ids[i]
+        return (self.timestamps[i], self.stream_name(i), self.messages[i])
+
+    def take(self, indices):
+        batch = LogBatch(complete=self.complete)
+        for i in indices:
+            batch.append_from(self, i)
+        return batch
+
+    def event(self, i):
+        event = {"timestamp": self.timestamps[i], "message": self.messages[i],
+                 "ingestionTime": self.ingestion_times[i], "logStreamName": self.stream_name(i)}
+        if self.event_ids is not None and self.event_ids[i] is not None:
+            event["eventId"] = self.event_ids[i]
+        return event
+
+    def __iter__(self):
+        return (self.event(i) for i in range(len(self)))
+
+    def to_json(self):
+        data = {"events": list(self)}
+        if self.complete is not None:  # Kept so spilled / cached batches still say whether they were truncated
+            data["complete"] = self.complete
+        return data
+
+
+def json_default(value):
+    """
+    `default=` hook for json.dumps: containers serialize to their original JSON shape, datetimes to ISO-8601.
+    Any other type raises TypeError rather than being silently stringified into LLM messages or cache keys.
+    """
+    if isinstance(value, (MetricResult, MetricSeries, LogBatch)):
+        return value.to_json()
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def to_jsonable(value):
+    """Recursively replaces containers by their JSON shapes (for consumers that need plain dicts/lists)."""
+    if isinstance(value, (MetricResult, MetricSeries, LogBatch)):
+        return value.to_json()
+    if isinstance(value, dict):
+        return {k: to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v) for v in value]
+    return value
+
+def from_json(value):
+    """Builds the matching container from a metric or log JSON shape; errors and other values pass through."""
+    if not isinstance(value, dict) or "error" in value:
+        return value
+    if "Series" in value or "Timestamps" in value:
+        return MetricResult.from_json(value)
+    if isinstance(value.get("events"), list):
+        return LogBatch(value["events"], value.get("complete"))
+    return value
+
+def is_error(result):
+    return isinstance(result, dict) and "error" in result
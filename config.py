@@ -29,6 +29,77 @@ MOCK_METRICS = [
     "DiskReadOps", "DiskWriteOps", "DatabaseConnections", "Invocations", "Errors"
 ]
 
+# Observability: span timings/counters are always cheap; JSON span logs are opt-in.
+TELEMETRY_ENABLED = os.environ.get("SRE_AGENT_TELEMETRY", "1") != "0"
+TELEMETRY_JSON_LOGS = os.environ.get("SRE_AGENT_TELEMETRY_JSON_LOGS", "0") == "1"
+TELEMETRY_METRICS_PORT = int(os.environ.get("SRE_AGENT_METRICS_PORT", "0")) # 0 disables the Prometheus /metrics endpoint
+TELEMETRY_METRICS_HOST = os.environ.get("SRE_AGENT_METRICS_HOST", "127.0.0.1") # The endpoint is unauthenticated; widen deliberately
+
+# LLM response cache: repeated questions with unchanged tool output skip both Gemini calls.
+RESPONSE_CACHE_ENABLED = os.environ.get("SRE_AGENT_RESPONSE_CACHE", "1") != "0"
+RESPONSE_CACHE_TTL_SECONDS = 300
+RESPONSE_CACHE_MAX_ENTRIES = 256
+RESPONSE_CACHE_HISTORY_WINDOW = 1 # Number of preceding user queries that are part of the cache key
+
+# Deadlines: every user turn gets a time budget that caps each LLM and backend call.
+TURN_DEADLINE_SECONDS = 60
+BACKEND_TIMEOUT_SECONDS = 15 # Upper bound for a single mock API / CloudWatch request
+DEADLINE_WORKER_THREADS = 32
+# Hedged requests: resend an idempotent backend read once it is slower than the observed p95.
+HEDGED_REQUESTS_ENABLED = True
+HEDGE_QUANTILE = 0.95
+HEDGE_MIN_SAMPLES = 20 # Don't hedge a backend until this many latencies have been observed
+HEDGE_BUDGET_RATIO = 0.05 # At most ~5% of a backend's requests are hedged...
+HEDGE_BUDGET_BURST = 5 # ...with this many hedges allowed in a burst
+
+FLEET_SCAN_CONCURRENCY = 8 # Parallel mock API requests when scanning every service for a metric
+
+# Long metric ranges are split into windows that fit one request's datapoint cap and fetched in parallel.
+METRIC_MAX_DATAPOINTS_MOCK = 1000 # The mock Lambda stops generating after ~1000 points
+METRIC_MAX_DATAPOINTS_CLOUDWATCH = 100800 # GetMetricData limit per request, shared by all returned series
+METRIC_FETCH_CONCURRENCY = 4
+
+# Log events fetched in a session are indexed so narrower follow-up filters are answered locally.
+LOG_INDEX_ENABLED = True
+LOG_INDEX_MAX_EVENTS = 50000 # Per session, across all log groups; the least recently queried group is dropped first,
+                             # then the oldest events of a group that alone exceeds it
+
+# Live tail: polls a log group from a high-water mark and appends new events to a bounded buffer.
+LOG_TAIL_POLL_SECONDS = 5
+LOG_TAIL_INITIAL_LOOKBACK_SECONDS = 60
+LOG_TAIL_OVERLAP_SECONDS = 30 # Re-read window for events CloudWatch ingests late (duplicates are dropped by event ID)
+LOG_TAIL_MAX_EVENTS_PER_POLL = 200
+LOG_TAIL_MAX_LAG_SECONDS = 300 # Skip ahead instead of falling further behind a noisy group
+LOG_TAIL_BUFFER_EVENTS = 500 # Rows kept on screen; older ones are dropped
+
+# Model tiers: a low-latency model picks the tool and extracts its arguments; the large model is used
+# when that routing looks unreliable and for root-cause analysis.
+LLM_MODEL_TIERS = {
+    "fast": os.environ.get("SRE_AGENT_FAST_MODEL", "gemini-1.5-flash-latest"),
+    "large": os.environ.get("SRE_AGENT_LARGE_MODEL", "gemini-1.5-pro-latest"),
+}
+LLM_ROUTING_TIER = "fast"
+LLM_SUMMARY_TIER = "fast" # Plain summaries of fetched data
+LLM_ANALYSIS_TIER = "large" # Root-cause synthesis and escalated routing
+LLM_ANALYSIS_KEYWORDS = ("root cause", "rca", "why", "investigate", "diagnose", "correlate")
+# A direct (tool-less) answer from the routing tier is only re-asked on the large model if it contains one of these
+LLM_LOW_CONFIDENCE_MARKERS = ("i'm not sure", "i am not sure", "i'm unable to", "i am unable to", "i don't know",
+                              "i do not know", "i cannot help", "i can't help")
+
+# Multi-step agent loop: after each wave of tool results the model may request more tools before answering.
+# The caps bound a turn's latency and cost; once one is hit the model answers with the data gathered so far.
+AGENT_MAX_ITERATIONS = 4 # Tool waves per user turn
+AGENT_MAX_TOKENS_PER_TURN = 60000 # Input + output tokens of all LLM calls of a turn
+AGENT_MAX_LOOP_SECONDS = 30 # No new tool wave starts after this; leaves time for the answer within TURN_DEADLINE_SECONDS
+AGENT_TOOL_WAVE_WORKERS = 16 # Tool calls running at the same time, shared by the turns of all sessions
+
+# Large tool results are kept once in a content-addressed store; chat messages hold references to them.
+ARTIFACT_INLINE_MAX_BYTES = 4096 # Smaller results stay inline in the message
+ARTIFACT_STORE_MAX_MEMORY_BYTES = 64 * 1024 * 1024 # Per server process; least recently used artifacts spill to disk
+ARTIFACT_STORE_DIR = os.environ.get("SRE_AGENT_ARTIFACT_DIR") # None: a private temporary directory per process
+ARTIFACT_STORE_MAX_DISK_BYTES = 512 * 1024 * 1024
+ARTIFACT_HISTORY_PREVIEW_CHARS = 2000 # Earlier tool outputs in the LLM history are cut to this many characters
+
 # Helper to get log group for a service if defined, otherwise use a generic pattern
 def get_log_group_for_service(service_name_or_log_group):
     if service_name_or_log_group in MOCK_SERVICES:
@@ -0,0 +1,263 @@
+# deadline.py
+import collections
+import concurrent.futures
+import contextlib
+import contextvars
+import threading
+import time
+
+import config
+import telemetry
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the current turn's deadline has passed or the turn was cancelled."""
+
+
+class Deadline:
+    """
+    A point in time by which a user turn must finish, plus a cancellation flag.
+    `timeout_seconds=None` means no time limit (the turn can still be cancelled).
+    """
+
+    def __init__(self, timeout_seconds=None):
+        self.timeout_seconds = timeout_seconds
+        self._expires_at = time.monotonic() + timeout_seconds if timeout_seconds else None
+        self._cancelled = threading.Event()
+
+    def remaining(self):
+        """Seconds left, or None when there is no time limit."""
+        if self._expires_at is None:
+            return None
+        return max(0.0, self._expires_at - time.monotonic())
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def expired(self):
+        return self.cancelled or (self._expires_at is not None and time.monotonic() >= self._expires_at)
+
+    def check(self, what="operation"):
+        if self.cancelled:
+            raise DeadlineExceeded(f"Cancelled before {what} could finish.")
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline of {self.timeout_seconds}s reached before {what} could finish.")
+
+
+_current_deadline = contextvars.ContextVar("sre_agent_deadline", default=None)
+
+def current():
+    return _current_deadline.get()
+
+@contextlib.contextmanager
+def scope(deadline):
+    """Makes `deadline` current for the block (and for work submitted through this module from it)."""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+def check(what="operation"):
+    deadline = current()
+    if deadline is not None:
+        deadline.check(what)
+
+def timeout_for(default_seconds):
+    """A per-call timeout: `default_seconds`, capped by whatever is left of the current deadline."""
+    deadline = current()
+    if deadline is None:
+        return default_seconds
+    deadline.check()
+    remaining = deadline.remaining()
+    if remaining is None:
+        return default_seconds
+    return max(0.1, min(default_seconds, remaining))
+
+
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=config.DEADLINE_WORKER_THREADS,
+                                                  thread_name_prefix="sre-agent-call")
+_POLL_INTERVAL_SECONDS = 0.1
+_in_flight = 0 # Tasks submitted to _executor and not finished yet (running or queued)
+_in_flight_lock = threading.Lock()
+
+def _task_finished(_future):
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight -= 1
+
+def submit(func, *args, **kwargs):
+    """Runs `func` on the shared worker pool with the caller's context (deadline, correlation ID)."""
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += 1
+    future = _executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+    future.add_done_callback(_task_finished)
+    return future
+
+def pool_saturated():
+    """True when every worker is busy, i.e. new work would wait in the queue."""
+    return _in_flight >= config.DEADLINE_WORKER_THREADS
+
+def _cancel_pending(futures):
+    # Queued calls nobody waits for any more are dropped; running ones can't be interrupted.
+    for future in futures:
+        future.cancel()
+
+def _wait_first(futures, deadline, what, timeout=None):
+    """
+    Waits until one of `futures` completes, honouring cancellation and the deadline.
+    With `timeout`, gives up after that many seconds and returns an empty `done` set.
+    """
+    pending = set(futures)
+    give_up_at = None if timeout is None else time.monotonic() + timeout
+    while True:
+        wait_for = None
+        if deadline is not None:
+            deadline.check(what)
+            remaining = deadline.remaining()
+            wait_for = _POLL_INTERVAL_SECONDS if remaining is None else min(_POLL_INTERVAL_SECONDS, remaining)
+        if give_up_at is not None:
+            left = max(0.0, give_up_at - time.monotonic())
+            wait_for = left if wait_for is None else min(wait_for, left)
+        done, pending = concurrent.futures.wait(pending, timeout=wait_for,
+                                                return_when=concurrent.futures.FIRST_COMPLETED)
+        if done or (give_up_at is not None and time.monotonic() >= give_up_at):
+            return done, pending
+
+def wait_all(futures, what="calls"):
+    """
+    Waits for every one of `futures`, honouring cancellation and the current deadline. On DeadlineExceeded
+    the remaining futures are abandoned (queued ones are cancelled) instead of being waited for.
+    """
+    deadline = current()
+    pending = set(futures)
+    try:
+        while pending:
+            _, pending = _wait_first(pending, deadline, what)
+    except DeadlineExceeded:
+        _cancel_pending(pending)
+        raise
+
+def run_with_deadline(func, *args, what="call", **kwargs):
+    """
+    Calls `func` but stops waiting for it once the current deadline expires or the turn is cancelled,
+    raising DeadlineExceeded. Python threads can't be killed, so an abandoned call keeps running in the
+    background and its result is discarded. Without a current deadline this is a plain call.
+    """
+    deadline = current()
+    if deadline is None:
+        return func(*args, **kwargs)
+    deadline.check(what)
+    future = submit(func, *args, **kwargs)
+    try:
+        done, _ = _wait_first([future], deadline, what)
+    except DeadlineExceeded:
+        _cancel_pending([future])
+        raise
+    return done.pop().result()
+
+
+class LatencyTracker:
+    """Rolling window of recent latencies for one backend, used to decide when to hedge."""
+
+    def __init__(self, window=200):
+        self._samples = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q):
+        """Returns the q-quantile of the window, or None until HEDGE_MIN_SAMPLES samples were seen."""
+        with self._lock:
+            if len(self._samples) < config.HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+_latency_trackers = collections.defaultdict(LatencyTracker)
+
+
+class HedgeBudget:
+    """
+    Token bucket limiting hedges to a fraction of requests: every request adds HEDGE_BUDGET_RATIO tokens
+    (up to HEDGE_BUDGET_BURST), every hedge spends one. Keeps hedging from doubling load when a backend is slow.
+    """
+
+    def __init__(self):
+        self._tokens = float(config.HEDGE_BUDGET_BURST)
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock:
+            self._tokens = min(float(config.HEDGE_BUDGET_BURST), self._tokens + config.HEDGE_BUDGET_RATIO)
+
+    def try_spend(self):
+        with self._lock:
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+_hedge_budgets = collections.defaultdict(HedgeBudget)
+
+def hedged_call(backend, func, *args, **kwargs):
+    """
+    Calls an idempotent backend read. If it hasn't answered after the backend's observed
+    p95 (HEDGE_QUANTILE) latency, one duplicate request is sent and whichever answers first wins.
+    Honors the current deadline/cancellation like `run_with_deadline`.
+    """
+    deadline = current()
+    tracker = _latency_trackers[backend]
+    budget = _hedge_budgets[backend]
+    budget.record_request()
+    hedge_after = tracker.quantile(config.HEDGE_QUANTILE) if config.HEDGED_REQUESTS_ENABLED else None
+    if hedge_after is None and deadline is None:
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        tracker.record(time.perf_counter() - start)
+        return result
+
+    what = f"{backend} request"
+    if deadline is not None:
+        deadline.check(what)
+    start = time.perf_counter()
+    futures = [submit(func, *args, **kwargs)]
+    try:
+        if hedge_after is not None:
+            done, _ = _wait_first(futures, deadline, what, timeout=hedge_after)
+            if not done:
+                if pool_saturated():
+                    # A hedge would only queue behind other work and add to the overload.
+                    skip_reason = "pool_saturated"
+                elif not budget.try_spend():
+                    skip_reason = "budget"
+                else:
+                    skip_reason = None
+                if skip_reason:
+                    telemetry.increment("sre_agent_hedges_skipped_total", "Hedged requests not sent, by reason.",
+                                        backend=backend, reason=skip_reason)
+                else:
+                    print(f"DEADLINE: {backend} slower than p{int(config.HEDGE_QUANTILE * 100)} ({hedge_after:.2f}s); sending hedged request.")
+                    telemetry.increment("sre_agent_hedged_requests_total", "Duplicate requests sent because the first was slow.",
+                                        backend=backend)
+                    futures.append(submit(func, *args, **kwargs))
+
+        pending = futures
+        while True:
+            done, pending = _wait_first(pending, deadline, what)
+            for future in done:
+                if future.exception() is None:
+                    tracker.record(time.perf_counter() - start)
+                    return future.result()
+            if not pending:
+                # Every attempt failed; surface the primary request's error.
+                return futures[0].result()
+    finally:
+        _cancel_pending(futures)
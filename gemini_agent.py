@@ -4,68 +4,52 @@ import sys
 
 import config
 import aws_utils 
-import requests
+import telemetry
+import response_cache
+import deadline
+import metric_retrieval
+import log_index
+import artifact_store
+import compact_data
 import json
 import datetime
 import time
 import random 
+import uuid
+import heapq
+import concurrent.futures
+import contextvars
 
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.tools import Tool
-from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_core.messages import HumanMessage, AIMessage, ToolMessage, SystemMessage
+# langchain, requests and boto3 (via aws_utils) are imported lazily, on the code path that needs them,
+# so importing this module (and starting the Streamlit server) stays fast.
 
 _USE_MOCK_DATA_GLOBALLY = True
 
-class GetAWSMetricToolInput(BaseModel):
-    service_name: str = Field(description="The name or ID of the AWS service/resource (e.g., 'ec2-instance-A'). REQUIRED.")
-    metric_name: str = Field(description="The name of the metric (e.g., 'CPUUtilization', 'MemoryUtilization'). REQUIRED.")
-    time_range_str: str = Field(default="last hour", description="Natural language time duration for the metric data (e.g., 'last 3 hours'). Defaults to 'last hour'.")
-    statistic: str = Field(default="Average", description="The statistic to retrieve (e.g., 'Average', 'Sum'). Defaults to 'Average'.")
-    period_seconds: int = Field(default=0, description="Granularity in seconds (e.g., 60, 300). Defaults to auto-calculated (0 means auto).")
-
-class GetAWSLogsToolInput(BaseModel):
-    service_or_log_group_name: str = Field(description="Service name (e.g., 'ecs-service-X') or full CloudWatch Log Group name. REQUIRED.")
-    time_range_str: str = Field(default="last hour", description="Natural language time duration for logs. Defaults to 'last hour'.")
-    filter_pattern: str = Field(default="", description="CloudWatch Logs filter pattern (e.g., 'ERROR'). Optional.")
-    limit: int = Field(default=50, description="Maximum number of log events. Defaults to 50.")
-
-class SuggestScalingActionToolInput(BaseModel):
-    service_name: str = Field(description="Name of the AWS service experiencing high load. REQUIRED.")
-    service_type: str = Field(description="Type of the AWS service (e.g., 'ECS Service', 'EC2 AutoScalingGroup'). REQUIRED.")
-    metric_name: str = Field(description="Name of the metric that is high (e.g., 'CPUUtilization'). REQUIRED.")
-    current_metric_value: str = Field(description="Current high metric value (e.g., '90%', '85'). REQUIRED.")
-
-class GetCloudWorkloadOverviewToolInput(BaseModel):
-    filter_criteria: str = Field(default="", description="Optional filter criteria like environment (e.g., 'production') or application name if known by user.")
-
-class ListRunningServicesToolInput(BaseModel):
-    service_type_filter: str = Field(default="", description="Optional filter for service type (e.g., 'Lambda', 'ECS', 'EC2'). If empty, attempts to list key services or asks for clarification.")
-    application_tag_or_prefix: str = Field(default="", description="Optional tag or naming prefix to filter services, especially useful for Lambda apps.")
-
-class GetClusterNodeCountToolInput(BaseModel):
-    cluster_or_asg_name: str = Field(description="The name of the ECS cluster, EKS cluster, or EC2 Auto Scaling Group. REQUIRED if user implies a specific cluster.")
-
-
-def tool_get_aws_metric(service_name: str, metric_name: str, 
-                        time_range_str: str = "last hour", 
-                        statistic: str = "Average", 
-                        period_seconds: int = 0) -> dict:
-    global _USE_MOCK_DATA_GLOBALLY
-    print(f"TOOL_FUNC: tool_get_aws_metric called with: service_name='{service_name}', metric_name='{metric_name}', "
-          f"time_range_str='{time_range_str}', statistic='{statistic}', period_seconds={period_seconds}, "
-          f"use_mock_data={_USE_MOCK_DATA_GLOBALLY}")
-
-    start_dt_utc, end_dt_utc = aws_utils.parse_time_range(time_range_str)
-
-    if period_seconds == 0:
-        duration_hours = (end_dt_utc - start_dt_utc).total_seconds() / 3600
-        if duration_hours <= 1: period_seconds = 60
-        elif duration_hours <= 6: period_seconds = 300
-        else: period_seconds = 3600
-    
-    print(f"TOOL_FUNC: Calculated period: {period_seconds}s for time range '{time_range_str}'")
-
+def _mock_api_get(path: str, params: dict):
+    """
+    GET against the mock API Gateway, bounded by the current turn's deadline (and hedged when slow).
+    Raises requests.RequestException on failure, deadline.DeadlineExceeded when out of time.
+    """
+    import requests
+
+    def _get():
+        response = requests.get(f"{config.MOCK_API_ENDPOINT}{path}", params=params,
+                                timeout=deadline.timeout_for(config.BACKEND_TIMEOUT_SECONDS))
+        response.raise_for_status()
+        return response.json()
+
+    with telemetry.span("http", f"mock_api{path}"):
+        return deadline.hedged_call(f"mock_api{path}", _get)
+
+def _auto_period_seconds(start_dt_utc, end_dt_utc) -> int:
+    duration_hours = (end_dt_utc - start_dt_utc).total_seconds() / 3600
+    if duration_hours <= 1: return 60
+    elif duration_hours <= 6: return 300
+    else: return 3600
+
+def _fetch_metric_window(service_name: str, metric_name: str, start_dt_utc, end_dt_utc, period_seconds: int,
+                         statistic: str, statistics: list, expressions: list, multi_series: bool) -> dict:
+    """One backend request for one time window: a compact_data.MetricResult or {"error": ...}."""
     if _USE_MOCK_DATA_GLOBALLY:
         mock_params = {
             "service_name": service_name, "metric_name": metric_name,
@@ -73,21 +57,111 @@ def tool_get_aws_metric(service_name: str, metric_name: str,
             "end_time": end_dt_utc.isoformat().replace("+00:00", "Z"),
             "period": period_seconds
         }
+        if multi_series:
+            mock_params["statistics"] = ",".join(statistics)
+            mock_params["expressions"] = json.dumps(expressions)
+        elif statistic != "Average": # The mock's default series is the Average
+            mock_params["statistics"] = statistic
+        import requests
         try:
-            response = requests.get(f"{config.MOCK_API_ENDPOINT}/metrics", params=mock_params, timeout=15)
-            response.raise_for_status()
-            return response.json() 
+            return compact_data.from_json(_mock_api_get("/metrics", mock_params))
         except requests.RequestException as e:
             return {"error": f"Mock API call failed for metrics: {str(e)}"}
     else: 
         cw_params = aws_utils.get_cw_params_for_service(service_name, metric_name)
         if not cw_params or "namespace" not in cw_params or "dimensions" not in cw_params:
              return {"error": f"Could not determine CloudWatch parameters for service '{service_name}'."}
+        if multi_series:
+            return aws_utils.get_metric_statistics_from_cw(
+                namespace=cw_params["namespace"], metric_name=metric_name, dimensions=cw_params["dimensions"],
+                start_time=start_dt_utc, end_time=end_dt_utc, period=period_seconds,
+                statistics=statistics, expressions=expressions
+            )
         return aws_utils.get_metric_data_from_cw(
             namespace=cw_params["namespace"], metric_name=metric_name, dimensions=cw_params["dimensions"],
             start_time=start_dt_utc, end_time=end_dt_utc, period=period_seconds, statistic=statistic
         )
 
+def iter_aws_metric_chunks(service_name: str, metric_name: str, 
+                           time_range_str: str = "last hour", 
+                           statistic: str = "Average", 
+                           period_seconds: int = 0,
+                           statistics: list = None,
+                           expressions: list = None):
+    """
+    Yields the metric data for the range chunk by chunk, in time order. Long ranges are split into
+    windows that fit the backend's per-request datapoint cap and fetched concurrently
+    (METRIC_FETCH_CONCURRENCY); points shared by adjacent windows are dropped.
+    """
+    # Several statistics and/or metric math are evaluated by the backend in one request and come back as a
+    # multi-series result ({"Series": [...]} in JSON); a single plain statistic keeps the {"Timestamps", "Values"} shape.
+    statistics = list(statistics or [])
+    expressions = list(expressions or [])
+    if len(statistics) == 1 and not expressions:
+        statistic = statistics[0]
+    multi_series = len(statistics) > 1 or bool(expressions)
+    if not statistics:
+        statistics = [statistic]
+
+    start_dt_utc, end_dt_utc = aws_utils.parse_time_range(time_range_str)
+
+    if period_seconds == 0:
+        period_seconds = _auto_period_seconds(start_dt_utc, end_dt_utc)
+
+    series_count = len(statistics) + len(expressions) if multi_series else 1
+    windows = metric_retrieval.plan_metric_chunks(
+        start_dt_utc, end_dt_utc, period_seconds,
+        metric_retrieval.max_datapoints_per_request(_USE_MOCK_DATA_GLOBALLY, series_count))
+    print(f"TOOL_FUNC: Calculated period: {period_seconds}s for time range '{time_range_str}' ({len(windows)} request window(s))")
+
+    def _fetch(window_start, window_end):
+        return _fetch_metric_window(service_name, metric_name, window_start, window_end, period_seconds,
+                                    statistic, statistics, expressions, multi_series)
+
+    yield from metric_retrieval.iter_deduplicated_chunks(metric_retrieval.iter_metric_chunks(_fetch, windows))
+
+def tool_get_aws_metric(service_name: str, metric_name: str, 
+                        time_range_str: str = "last hour", 
+                        statistic: str = "Average", 
+                        period_seconds: int = 0,
+                        statistics: list = None,
+                        expressions: list = None) -> dict:
+    global _USE_MOCK_DATA_GLOBALLY
+    print(f"TOOL_FUNC: tool_get_aws_metric called with: service_name='{service_name}', metric_name='{metric_name}', "
+          f"time_range_str='{time_range_str}', statistic='{statistic}', period_seconds={period_seconds}, "
+          f"statistics={statistics}, expressions={expressions}, use_mock_data={_USE_MOCK_DATA_GLOBALLY}")
+    return metric_retrieval.stitch_metric_chunks(iter_aws_metric_chunks(
+        service_name, metric_name, time_range_str, statistic, period_seconds, statistics, expressions))
+
+def export_aws_metric(destination, service_name: str, metric_name: str, file_format: str = "csv", **metric_kwargs) -> int:
+    """
+    Streams a (possibly very long) metric range straight to a CSV or Parquet file, chunk by chunk,
+    without assembling it in memory. Accepts the same keyword arguments as tool_get_aws_metric.
+    Returns the number of rows written.
+    """
+    return metric_retrieval.write_metric_chunks(
+        iter_aws_metric_chunks(service_name, metric_name, **metric_kwargs), destination, file_format)
+
+def fetch_log_events(log_group_name: str, start_time_ms: int, end_time_ms: int, filter_pattern: str = "",
+                     limit: int = 50, use_mock_data: bool = None) -> dict:
+    """One backend request for the log events of [start_time_ms, end_time_ms]: a compact_data.LogBatch or {"error": ...}."""
+    if use_mock_data is None:
+        use_mock_data = _USE_MOCK_DATA_GLOBALLY
+    if use_mock_data:
+        mock_params = {
+            "log_group_name": log_group_name, "start_time": start_time_ms, "end_time": end_time_ms,
+            "filter_pattern": filter_pattern, "limit": limit
+        }
+        import requests
+        try:
+            return compact_data.from_json(_mock_api_get("/logs", mock_params))
+        except requests.RequestException as e:
+            return {"error": f"Mock API call failed for logs: {str(e)}"}
+    return aws_utils.get_logs_from_cw(
+        log_group_name=log_group_name, start_time_epoch_ms=start_time_ms,
+        end_time_epoch_ms=end_time_ms, filter_pattern=filter_pattern, limit=limit
+    )
+
 def tool_get_aws_logs(service_or_log_group_name: str, 
                       time_range_str: str = "last hour", 
                       filter_pattern: str = "", 
@@ -102,22 +176,16 @@ def tool_get_aws_logs(service_or_log_group_name: str,
     end_time_ms = int(end_dt_utc.timestamp() * 1000)
     actual_log_group_name = config.get_log_group_for_service(service_or_log_group_name)
 
-    if _USE_MOCK_DATA_GLOBALLY:
-        mock_params = {
-            "log_group_name": actual_log_group_name, "start_time": start_time_ms, "end_time": end_time_ms,
-            "filter_pattern": filter_pattern, "limit": limit
-        }
-        try:
-            response = requests.get(f"{config.MOCK_API_ENDPOINT}/logs", params=mock_params, timeout=15)
-            response.raise_for_status()
-            return response.json() 
-        except requests.RequestException as e:
-            return {"error": f"Mock API call failed for logs: {str(e)}"}
-    else: 
-        return aws_utils.get_logs_from_cw(
-            log_group_name=actual_log_group_name, start_time_epoch_ms=start_time_ms,
-            end_time_epoch_ms=end_time_ms, filter_pattern=filter_pattern, limit=limit
-        )
+    def fetch_window(window_start_ms, window_end_ms):
+        return fetch_log_events(actual_log_group_name, window_start_ms, window_end_ms, filter_pattern, limit)
+
+    # Log events this session already fetched answer narrower follow-up filters over covered windows.
+    session_log_index = log_index.current()
+    if not config.LOG_INDEX_ENABLED or session_log_index is None:
+        return fetch_window(start_time_ms, end_time_ms)
+    match_mode = log_index.MATCH_SUBSTRING if _USE_MOCK_DATA_GLOBALLY else log_index.MATCH_CLOUDWATCH
+    return session_log_index.query(actual_log_group_name, start_time_ms, end_time_ms, filter_pattern, limit,
+                            fetch_window, match_mode)
 
 def tool_suggest_scaling_action(service_name: str, service_type: str, 
                                 metric_name: str, current_metric_value: str) -> dict:
@@ -188,8 +256,115 @@ def tool_get_cluster_node_count(cluster_or_asg_name: str = "") -> dict:
         return {"node_count_text": "Please specify the name of the cluster or Auto Scaling Group for which you want the node count."}
     return {"node_count_text": f"Mock: The cluster/ASG '{cluster_or_asg_name}' currently has {random.randint(2, 8)} running nodes/instances. (This is mock data)."}
 
+_FLEET_SCORE_FUNCTIONS = {
+    "average": lambda values: sum(values) / len(values),
+    "max": max,
+    "latest": lambda values: values[-1],
+    "p95": lambda values: sorted(values)[min(len(values) - 1, int(0.95 * len(values)))],
+}
+
+def _fleet_series_values_mock(service_names, metric_name, start_dt_utc, end_dt_utc, period_seconds, statistic):
+    """Fetches each service's series from the mock API concurrently. Yields (service_name, values or None)."""
+    import requests
+    params_common = {
+        "metric_name": metric_name,
+        "start_time": start_dt_utc.isoformat().replace("+00:00", "Z"),
+        "end_time": end_dt_utc.isoformat().replace("+00:00", "Z"),
+        "period": period_seconds,
+    }
+    if statistic != "Average": # The mock's default series is the Average
+        params_common["statistics"] = statistic
 
-_llm_with_tools = None
+    def _fetch(service_name):
+        try:
+            data = _mock_api_get("/metrics", dict(params_common, service_name=service_name))
+            return data.get("Values") if isinstance(data, dict) else None
+        except requests.RequestException as e:
+            print(f"TOOL_FUNC: Fleet scan fetch failed for '{service_name}': {e}")
+            return None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=config.FLEET_SCAN_CONCURRENCY,
+                                               thread_name_prefix="fleet-scan") as executor:
+        futures = {executor.submit(contextvars.copy_context().run, _fetch, name): name for name in service_names}
+        for future in concurrent.futures.as_completed(futures):
+            yield futures[future], future.result()
+
+def _fleet_series_values_cw(service_names, metric_name, start_dt_utc, end_dt_utc, period_seconds, statistic):
+    """Fetches every service's series with batched GetMetricData requests. Yields (service_name, values or None)."""
+    series_specs = []
+    for service_name in service_names:
+        cw_params = aws_utils.get_cw_params_for_service(service_name, metric_name)
+        if cw_params and "namespace" in cw_params and "dimensions" in cw_params:
+            series_specs.append({"key": service_name, "namespace": cw_params["namespace"], "dimensions": cw_params["dimensions"]})
+    fleet_data = aws_utils.get_fleet_metric_data_from_cw(series_specs, metric_name, start_dt_utc, end_dt_utc,
+                                                         period_seconds, statistic)
+    if "error" in fleet_data:
+        raise RuntimeError(fleet_data["error"])
+    for service_name in service_names:
+        yield service_name, fleet_data["series"].get(service_name)
+
+def tool_scan_fleet_metric(metric_name: str, time_range_str: str = "last hour", statistic: str = "Average",
+                           score: str = "average", top_k: int = 5, service_type_filter: str = "") -> dict:
+    global _USE_MOCK_DATA_GLOBALLY
+    print(f"TOOL_FUNC: tool_scan_fleet_metric called with: metric_name='{metric_name}', time_range_str='{time_range_str}', "
+          f"statistic='{statistic}', score='{score}', top_k={top_k}, type_filter='{service_type_filter}', "
+          f"use_mock_data={_USE_MOCK_DATA_GLOBALLY}")
+
+    score_key = score.lower() if score.lower() in _FLEET_SCORE_FUNCTIONS else "average"
+    score_function = _FLEET_SCORE_FUNCTIONS[score_key]
+    top_k = max(1, int(top_k))
+    service_names = [name for name, info in config.MOCK_SERVICES.items()
+                     if not service_type_filter or service_type_filter.lower() in info.get("type", "").lower()]
+    if not service_names:
+        return {"error": f"No services in the registry match type filter '{service_type_filter}'."}
+
+    start_dt_utc, end_dt_utc = aws_utils.parse_time_range(time_range_str)
+    period_seconds = _auto_period_seconds(start_dt_utc, end_dt_utc)
+    if _USE_MOCK_DATA_GLOBALLY:
+        series_iter = _fleet_series_values_mock(service_names, metric_name, start_dt_utc, end_dt_utc, period_seconds, statistic)
+    else:
+        series_iter = _fleet_series_values_cw(service_names, metric_name, start_dt_utc, end_dt_utc, period_seconds, statistic)
+
+    # Keep only the K best scores: a min-heap of size K, so memory and payload don't grow with the fleet.
+    top_heap = []
+    services_without_data = []
+    partial_reason = None
+    try:
+        for service_name, values in series_iter:
+            numeric_values = [v for v in (values or []) if isinstance(v, (int, float))]
+            if not numeric_values:
+                services_without_data.append(service_name)
+                continue
+            entry = (score_function(numeric_values), service_name, len(numeric_values))
+            if len(top_heap) < top_k:
+                heapq.heappush(top_heap, entry)
+            elif entry[0] > top_heap[0][0]:
+                heapq.heapreplace(top_heap, entry)
+    except RuntimeError as e:
+        return {"error": f"Fleet scan failed for {metric_name}: {e}"}
+    except deadline.DeadlineExceeded as e:
+        # Rank whatever arrived in time rather than returning nothing.
+        partial_reason = str(e)
+
+    top_services = [{"service_name": name, "score": round(value, 2), "datapoints": count}
+                    for value, name, count in sorted(top_heap, reverse=True)]
+    ranking_text = ", ".join(f"{s['service_name']} ({s['score']})" for s in top_services) or "no services returned data"
+    scan_result = {
+        "metric_name": metric_name,
+        "score": score_key,
+        "time_range": time_range_str,
+        "services_scanned": len(service_names),
+        "services_without_data": sorted(services_without_data),
+        "top_services": top_services,
+        "scan_text": f"Top {len(top_services)} of {len(service_names)} services by {score_key} {metric_name} over {time_range_str}: {ranking_text}."
+    }
+    if partial_reason:
+        scan_result["partial"] = f"Scan incomplete, ranking covers only services that answered in time: {partial_reason}"
+    return scan_result
+
+
+_llms_with_tools = {}  # model tier -> chat model bound to the tools
+_tool_arg_schemas = {}  # tool name -> pydantic argument schema
 _tools_map = {
     "GetAWSMetric": tool_get_aws_metric,
     "GetAWSLogs": tool_get_aws_logs,
@@ -197,8 +372,41 @@ _tools_map = {
     "GetCloudWorkloadOverview": tool_get_cloud_workload_overview,
     "ListRunningServices": tool_list_running_services,
     "GetClusterNodeCount": tool_get_cluster_node_count,
+    "ScanFleetMetric": tool_scan_fleet_metric,
+}
+
+# How the final answer is produced for each tool:
+#   "template" - the tool already returns ready-to-display text, which is rendered directly (no second LLM call)
+#   "llm"      - the tool output is sent back to the LLM for analysis/summarization
+# Tools missing from this map use "llm".
+_TOOL_RESPONSE_POLICIES = {
+    "GetAWSMetric": "llm",
+    "GetAWSLogs": "llm",
+    "SuggestScalingAction": "template",
+    "GetCloudWorkloadOverview": "template",
+    "ListRunningServices": "template",
+    "GetClusterNodeCount": "template",
+    "ScanFleetMetric": "llm",
 }
 
+def _render_tool_response_template(tool_name: str, tool_output) -> str:
+    """
+    Renders the final answer for a "template" policy tool from its own output.
+    Returns None when the output doesn't have the expected shape (e.g. an error), so the caller falls back to the LLM.
+    """
+    if not isinstance(tool_output, dict) or "error" in tool_output:
+        return None
+    if tool_name == "ListRunningServices":
+        return tool_output.get("services_text")
+    if tool_name == "GetClusterNodeCount":
+        return tool_output.get("node_count_text")
+    if tool_name == "GetCloudWorkloadOverview":
+        return tool_output.get("overview_text")
+    if tool_name == "SuggestScalingAction" and tool_output.get("suggestion_text"):
+        return (f"{tool_output['suggestion_text']} The suggested command is shown below; "
+                "replace the placeholder value before running it.")
+    return None
+
 SYSTEM_INSTRUCTION_EXPANDED = (
     "You are an expert AIOps assistant. Your primary purpose is to help users query AWS service metrics and logs, "
     "understand the state of their services, and get suggestions for remediation. You have tools to fetch data and provide information."
@@ -209,6 +417,10 @@ SYSTEM_INSTRUCTION_EXPANDED = (
     "\n- For 'How many nodes are running?', if no cluster/ASG is specified, use 'GetClusterNodeCount' but expect it to ask for the name. Your response should then ask the user for the name."
     "\n- For 'What is the name of the services which are running currently?', use the 'ListRunningServices' tool. You can pass an empty filter if none is implied by the user."
     "\n- For 'What is the name of the App which is hosted on Lambda?', use the 'ListRunningServices' tool with 'service_type_filter' as 'Lambda'."
+    "\n- You can work in several steps: request every independent tool call you need at once (they run in parallel), "
+    "  look at the results, then request further calls (e.g. the logs of the worst service) before answering. "
+    "  Don't repeat a call you already made in this turn; its result is above. The number of steps is limited."
+    "\n- For fleet-wide comparisons (e.g., 'Which services have the highest CPU?', 'What's the hottest service right now?'), use the 'ScanFleetMetric' tool once rather than querying services one by one."
     "\n\nWhen a user asks for a graph, plot, chart, or to visualize metrics:"
     "\n1. Use your 'GetAWSMetric' tool to retrieve the requested metric data."
     "\n2. Once the tool successfully returns the data, your textual response should confirm data retrieval and mention that the application will display the graph. "
@@ -231,19 +443,29 @@ SYSTEM_INSTRUCTION_EXPANDED = (
     "\n\nDefault Behaviors:"
     "\n- Time range for metrics/logs: 'last hour' if not specified."
     "\n- Metric statistic: 'Average' if not specified."
+    "\n- For several statistics (e.g. average, max and p99) or derived values (e.g. error rate), make ONE GetAWSMetric call with "
+    "'statistics' and/or 'expressions' (e.g. expressions=['ErrorRate=100*Errors_Sum/Invocations_Sum']) instead of computing them yourself."
     "\n- Metric period: Auto-calculated based on time range if not specified."
     "\n\nBe helpful, concise, and focus on fulfilling the user's AIOps requests by effectively using your tools or asking for clarification."
 )
 
 
-def get_llm_with_tools():
-    global _llm_with_tools
-    if _llm_with_tools is None:
+def get_llm_with_tools(tier: str = None):
+    """The chat model of `tier` (a key of config.LLM_MODEL_TIERS, default the routing tier) bound to the tools."""
+    tier = tier or config.LLM_ROUTING_TIER
+    if tier not in _llms_with_tools:
         if not config.GOOGLE_API_KEY:
             raise ValueError("GOOGLE_API_KEY is not configured.")
         
-        print("LANGCHAIN_DIRECT: Initializing LLM with tools (Expanded)...")
-        llm = ChatGoogleGenerativeAI(model="gemini-1.5-pro-latest",
+        model_name = config.LLM_MODEL_TIERS[tier]
+        print(f"LANGCHAIN_DIRECT: Initializing {tier} LLM ({model_name}) with tools (Expanded)...")
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        from langchain_core.tools import Tool
+        from tool_schemas import (GetAWSMetricToolInput, GetAWSLogsToolInput, SuggestScalingActionToolInput,
+                                  GetCloudWorkloadOverviewToolInput, ListRunningServicesToolInput,
+                                  GetClusterNodeCountToolInput, ScanFleetMetricToolInput)
+
+        llm = ChatGoogleGenerativeAI(model=model_name,
                                      google_api_key=config.GOOGLE_API_KEY,
                                      temperature=0.1, 
                                      )
@@ -255,126 +477,425 @@ def get_llm_with_tools():
             Tool(name="GetCloudWorkloadOverview", func=tool_get_cloud_workload_overview, description="Provides a high-level summary of active key services or workloads. Use if the user asks a very broad question like 'What is the workload currently running on cloud?'. This tool will likely ask for more specific filters if its initial response is too generic.", args_schema=GetCloudWorkloadOverviewToolInput),
             Tool(name="ListRunningServices", func=tool_list_running_services, description="Lists running services, potentially filtered by type (e.g., Lambda, ECS) or application tags/prefixes. Use if the user asks 'What is the name of the services which are running currently?' or 'What apps are hosted on Lambda?'. For the Lambda app query, set service_type_filter to 'Lambda'.", args_schema=ListRunningServicesToolInput),
             Tool(name="GetClusterNodeCount", func=tool_get_cluster_node_count, description="Gets the number of running nodes/instances for a specified cluster or Auto Scaling Group. Use if the user asks 'How many nodes are running?'. If no cluster/ASG name is given by the user, this tool will ask for it.", args_schema=GetClusterNodeCountToolInput),
+            Tool(name="ScanFleetMetric", func=tool_scan_fleet_metric, description="Evaluates one metric across every known service and returns only the top-K services by a score (average, max, latest or p95). Use for fleet-wide questions like 'Which services have the highest CPU right now?' instead of calling GetAWSMetric service by service.", args_schema=ScanFleetMetricToolInput),
         ]
-        _llm_with_tools = llm.bind_tools(langchain_tools)
-        print("LANGCHAIN_DIRECT: LLM with tools initialized (system instruction will be prepended to invoke).")
-    return _llm_with_tools
+        _tool_arg_schemas.update({t.name: t.args_schema for t in langchain_tools})
+        _llms_with_tools[tier] = llm.bind_tools(langchain_tools)
+        print(f"LANGCHAIN_DIRECT: {tier} LLM with tools initialized (system instruction will be prepended to invoke).")
+    return _llms_with_tools[tier]
+
+def warm_up():
+    """
+    Builds the process-wide LLM clients (every model tier) ahead of the first query. Safe to call repeatedly.
+    Returns False (without raising) when no Gemini API key is configured.
+    """
+    if not config.GOOGLE_API_KEY:
+        return False
+    for tier in config.LLM_MODEL_TIERS:
+        get_llm_with_tools(tier)
+    return True
 
 _conversation_history = [] 
 
-def get_langchain_direct_tool_call_response(user_query: str, use_mock_data: bool) -> dict:
+def _run_tool(tool_name: str, tool_function, tool_args: dict):
+    with telemetry.span("tool", tool_name) as sp:
+        result = tool_function(**tool_args)
+        if isinstance(result, dict) and "error" in result:
+            sp.set_status("error")
+        return result
+
+_LLM_LATENCY = telemetry.histogram("sre_agent_llm_latency_seconds", "LLM call latency by model tier and purpose.")
+
+def _invoke_llm(tier: str, messages, purpose: str):
+    """Invokes the model of `tier`, recording its latency and token usage per tier."""
+    llm_with_tools = get_llm_with_tools(tier)
+    with telemetry.span("llm", purpose, message_count=len(messages), tier=tier, model=config.LLM_MODEL_TIERS[tier]) as sp:
+        start = time.perf_counter()
+        response = deadline.run_with_deadline(llm_with_tools.invoke, messages, what=f"LLM {purpose}")
+        if config.TELEMETRY_ENABLED:
+            _LLM_LATENCY.observe(time.perf_counter() - start, tier=tier, purpose=purpose)
+        telemetry.increment("sre_agent_llm_calls_total", "LLM calls by model tier and purpose.", tier=tier, purpose=purpose)
+        usage = getattr(response, "usage_metadata", None) or {}
+        for direction in ("input", "output"):
+            tokens = usage.get(f"{direction}_tokens")
+            if tokens:
+                sp.set_attr(f"{direction}_tokens", tokens)
+                telemetry.increment("sre_agent_llm_tokens_total", "LLM tokens by model tier and direction.",
+                                    amount=tokens, tier=tier, direction=direction)
+        return response
+
+def _routing_escalation_reason(ai_msg):
+    """
+    Why a decision from the routing tier looks unreliable, or None if it looks fine. A direct answer
+    (greeting, clarifying question) is fine unless the model itself signals refusal or uncertainty.
+    """
+    tool_calls = getattr(ai_msg, "tool_calls", None)
+    if not tool_calls:
+        content = ai_msg.content if isinstance(ai_msg.content, str) else json.dumps(ai_msg.content)
+        if any(marker in content.lower() for marker in config.LLM_LOW_CONFIDENCE_MARKERS):
+            return "low confidence answer"
+        return None
+    for tool_call in tool_calls:
+        if tool_call["name"] not in _tools_map:
+            return "unknown tool"
+        schema = _tool_arg_schemas.get(tool_call["name"])
+        if schema is None:
+            continue
+        args = tool_call.get("args") or {}
+        for field_name, field in schema.__fields__.items():
+            if field.required and args.get(field_name) in (None, ""):
+                return "missing required argument"
+        try:
+            schema(**args)
+        except ValueError: # pydantic's ValidationError
+            return "invalid argument"
+    return None
+
+def _needs_analysis_tier(user_query: str, tool_response_contents: list) -> bool:
+    """Root-cause synthesis (RCA logs attached, or the user asked why/for the root cause) goes to the large model."""
+    query = user_query.lower()
+    return (any("rca_error_logs_output" in content for content in tool_response_contents)
+            or any(k in query for k in config.LLM_ANALYSIS_KEYWORDS))
+
+def _primary_metric_values(metric_result):
+    """Values of the requested metric itself: the plain series, or the first series of a multi-statistic result."""
+    if not isinstance(metric_result, compact_data.MetricResult) or not metric_result.series:
+        return None
+    return metric_result.series[0].numeric_values()
+
+def _replayable(cached_ai_msg):
+    """
+    A cached AIMessage ready to go into a history: a copy with new tool call IDs, so a decision cached
+    from one conversation never repeats (or shares) tool call IDs in another.
+    """
+    if cached_ai_msg is None or not getattr(cached_ai_msg, "tool_calls", None):
+        return cached_ai_msg
+    fresh_tool_calls = [dict(tool_call, id=f"call_{uuid.uuid4().hex}") for tool_call in cached_ai_msg.tool_calls]
+    copy_message = getattr(cached_ai_msg, "model_copy", None) or cached_ai_msg.copy
+    return copy_message(update={"tool_calls": fresh_tool_calls})
+
+def _recent_user_queries(window: int) -> list:
+    from langchain_core.messages import HumanMessage
+    if window <= 0:
+        return []
+    return [m.content for m in _conversation_history if isinstance(m, HumanMessage)][-window:]
+
+def get_langchain_direct_tool_call_response(user_query: str, use_mock_data: bool,
+                                            turn_deadline: deadline.Deadline = None,
+                                            session_log_index: log_index.SessionLogIndex = None) -> dict:
+    """
+    Answers one user turn. `turn_deadline` bounds every LLM and backend call of the turn and can be
+    cancelled from another thread; it defaults to config.TURN_DEADLINE_SECONDS.
+    `session_log_index` is the calling session's log index (without one, log queries always go to the backend).
+    "displays" lists every tool result to show, as {"tool_used", "data_for_display"}; "tool_used" and
+    "data_for_display" repeat the last of them. Large "data_for_display" results are returned as an
+    artifact_store.ArtifactRef; use artifact_store.resolve.
+    """
     global _USE_MOCK_DATA_GLOBALLY, _conversation_history
     _USE_MOCK_DATA_GLOBALLY = use_mock_data 
+    correlation_id = telemetry.new_correlation_id()
+    if turn_deadline is None:
+        turn_deadline = deadline.Deadline(config.TURN_DEADLINE_SECONDS)
+    with deadline.scope(turn_deadline), log_index.scope(session_log_index), \
+            telemetry.span("turn", "agent_turn", use_mock_data=use_mock_data):
+        response_package = _answer_user_query(user_query)
+    response_package["correlation_id"] = correlation_id
+    return response_package
+
+def _execute_tool_call(tool_name: str, tool_args: dict) -> dict:
+    """
+    Runs one tool call requested by the LLM and returns the content of its ToolMessage:
+    {"primary_tool_output": ...}, plus "rca_error_logs_output" when a CPU/memory metric came back high.
+    """
+    tool_function = _tools_map.get(tool_name)
+    if tool_function is None:
+        return {"primary_tool_output": {"error": f"LLM suggested an unknown tool: {tool_name}"}}
+    deadline.check(f"tool {tool_name}")
+    try:
+        primary_tool_result_data = _run_tool(tool_name, tool_function, tool_args)
+    except deadline.DeadlineExceeded:
+        raise
+    except Exception as e:
+        print(f"LANGCHAIN_DIRECT: Tool {tool_name} failed: {e}")
+        return {"primary_tool_output": {"error": f"{tool_name} failed: {str(e)}"}}
+    tool_response_content_dict = {"primary_tool_output": primary_tool_result_data}
+
+    # Rudimentary RCA: If high CPU/Memory metric, also fetch error logs
+    if tool_name != "GetAWSMetric":
+        return tool_response_content_dict
+    metric_name_from_args = tool_args.get("metric_name", "").upper()
+    primary_metric_values = _primary_metric_values(primary_tool_result_data)
+    if not ("CPU" in metric_name_from_args or "MEMORY" in metric_name_from_args) or not primary_metric_values:
+        return tool_response_content_dict
+    avg_value = sum(primary_metric_values) / len(primary_metric_values)
+    if ("CPU" in metric_name_from_args and avg_value > 80) or ("MEMORY" in metric_name_from_args and avg_value > 85):
+        print(f"LANGCHAIN_DIRECT: High critical metric for {tool_args.get('service_name')}. Fetching error logs for RCA.")
+        try:
+            error_log_args = {
+                "service_or_log_group_name": tool_args.get("service_name"),
+                "time_range_str": tool_args.get("time_range_str", "last hour"),
+                "filter_pattern": "ERROR OR Exception OR Timeout OR OOM OR Fail",
+                "limit": 10 
+            }
+            # Add RCA data to the *content* of the same ToolMessage
+            tool_response_content_dict["rca_error_logs_output"] = _run_tool("GetAWSLogs", tool_get_aws_logs, error_log_args)
+        except deadline.DeadlineExceeded:
+            raise
+        except Exception as rca_e:
+            print(f"LANGCHAIN_DIRECT: Error during implicit RCA log fetch: {rca_e}")
+            tool_response_content_dict["rca_error_logs_output"] = {"error": f"Failed to fetch RCA logs: {str(rca_e)}"}
+    return tool_response_content_dict
+
+# One pool for the tool calls of every turn in the process, separate from deadline's pool that the tools
+# themselves submit backend calls to (sharing it could leave tools waiting on calls queued behind them).
+_tool_wave_executor = concurrent.futures.ThreadPoolExecutor(max_workers=config.AGENT_TOOL_WAVE_WORKERS,
+                                                            thread_name_prefix="tool-wave")
+
+def _run_tool_wave(tool_calls: list, memo: dict) -> list:
+    """
+    Runs the tool calls of one agent iteration concurrently on the shared tool-wave pool.
+    `memo` maps (tool, canonical args) fingerprints to results already produced in this turn; such calls,
+    and duplicates within the wave, are not run again. Returns (content dict, reused) per call, in order.
+    Raises DeadlineExceeded as soon as the turn runs out of time, without waiting for the wave's other calls.
+    """
+    keys = [response_cache.fingerprint("tool_call", call["name"], call.get("args") or {}) for call in tool_calls]
+    to_run = {}
+    for call, key in zip(tool_calls, keys):
+        if key not in memo and key not in to_run:
+            to_run[key] = call
+    if to_run:
+        futures = {key: _tool_wave_executor.submit(contextvars.copy_context().run, _execute_tool_call,
+                                                   call["name"], call.get("args") or {})
+                   for key, call in to_run.items()}
+        deadline.wait_all(futures.values(), what="tool wave")
+        for key, future in futures.items():
+            memo[key] = future.result()
+
+    executed = {id(call) for call in to_run.values()}
+    results = []
+    for call, key in zip(tool_calls, keys):
+        reused = id(call) not in executed
+        telemetry.increment("sre_agent_tool_calls_total", "Tool calls requested by the LLM, run or reused within the turn.",
+                            tool=call["name"], source="reused" if reused else "executed")
+        results.append((memo[key], reused))
+    return results
+
+def _llm_tokens(ai_msg) -> int:
+    usage = getattr(ai_msg, "usage_metadata", None) or {}
+    return usage.get("total_tokens") or (usage.get("input_tokens") or 0) + (usage.get("output_tokens") or 0)
+
+def _loop_stop_reason(iteration: int, tokens_used: int, loop_started: float):
+    """Which cap (if any) prevents another tool wave."""
+    if iteration >= config.AGENT_MAX_ITERATIONS:
+        return "iterations"
+    if tokens_used >= config.AGENT_MAX_TOKENS_PER_TURN:
+        return "tokens"
+    if time.monotonic() - loop_started >= config.AGENT_MAX_LOOP_SECONDS:
+        return "time"
+    return None
+
+def _display_calls(executed_calls: list) -> list:
+    """
+    The calls whose output the UI shows: every distinct call of the turn that didn't fail, in order
+    (a reused call is shown once). Falls back to the last call when they all failed.
+    """
+    display_calls = [call for call in executed_calls
+                     if not call["reused"] and not compact_data.is_error(call["content"]["primary_tool_output"])]
+    return display_calls or executed_calls[-1:]
+
+def _answer_user_query(user_query: str) -> dict:
+    """
+    Runs the agent loop for one turn: the LLM requests a wave of tool calls, they run concurrently, their
+    results go back to the LLM, which either requests another wave or answers. Identical calls within the
+    turn are answered from the earlier result. AGENT_MAX_ITERATIONS / _TOKENS_PER_TURN / _LOOP_SECONDS
+    bound the loop; when one is reached the LLM is asked to answer with what it has.
+    """
+    global _conversation_history
+    from langchain_core.messages import HumanMessage, AIMessage, ToolMessage, SystemMessage
 
     if not config.GOOGLE_API_KEY:
          return {"text_summary": "Error: Gemini API Key is not configured.", "data_for_display": None, "tool_used": None, "script_suggestion": None}
 
-    llm_with_tools = get_llm_with_tools()
-    
     current_turn_messages_for_llm_decision = [
         SystemMessage(content=SYSTEM_INSTRUCTION_EXPANDED) 
     ] + _conversation_history + [
         HumanMessage(content=user_query)
     ]
+    loop_started = time.monotonic()
+    tokens_used = 0
 
     try:
-        print(f"LANGCHAIN_DIRECT: Invoking LLM for tool decision with query: '{user_query}'.")
-        ai_msg_with_potential_tool_call = llm_with_tools.invoke(current_turn_messages_for_llm_decision)
+        decision_cache_key = None
+        ai_msg_with_potential_tool_call = None
+        if config.RESPONSE_CACHE_ENABLED:
+            decision_cache_key = response_cache.decision_key(
+                user_query, _recent_user_queries(config.RESPONSE_CACHE_HISTORY_WINDOW), _USE_MOCK_DATA_GLOBALLY)
+            ai_msg_with_potential_tool_call = _replayable(response_cache.decisions.get(decision_cache_key))
+
+        if ai_msg_with_potential_tool_call is None:
+            print(f"LANGCHAIN_DIRECT: Invoking LLM for tool decision with query: '{user_query}'.")
+            ai_msg_with_potential_tool_call = _invoke_llm(config.LLM_ROUTING_TIER, current_turn_messages_for_llm_decision, "tool_decision")
+            tokens_used += _llm_tokens(ai_msg_with_potential_tool_call)
+            escalation_reason = _routing_escalation_reason(ai_msg_with_potential_tool_call)
+            if escalation_reason and config.LLM_ROUTING_TIER != config.LLM_ANALYSIS_TIER:
+                print(f"LANGCHAIN_DIRECT: Low-confidence routing ({escalation_reason}); asking the {config.LLM_ANALYSIS_TIER} model.")
+                telemetry.increment("sre_agent_llm_escalations_total", "Tool decisions re-run on the larger model.",
+                                    reason=escalation_reason)
+                ai_msg_with_potential_tool_call = _invoke_llm(config.LLM_ANALYSIS_TIER, current_turn_messages_for_llm_decision, "tool_decision")
+                tokens_used += _llm_tokens(ai_msg_with_potential_tool_call)
+            if decision_cache_key:
+                response_cache.decisions.put(decision_cache_key, ai_msg_with_potential_tool_call)
+        else:
+            print(f"LANGCHAIN_DIRECT: Reusing cached tool decision for query: '{user_query}'.")
                 
         print(f"LANGCHAIN_DIRECT: LLM AIMessage received. Tool calls: {ai_msg_with_potential_tool_call.tool_calls if hasattr(ai_msg_with_potential_tool_call, 'tool_calls') and ai_msg_with_potential_tool_call.tool_calls else 'None'}")
 
-        messages_for_final_summary = list(current_turn_messages_for_llm_decision)
-        messages_for_final_summary.append(ai_msg_with_potential_tool_call)
-
-        if hasattr(ai_msg_with_potential_tool_call, 'tool_calls') and ai_msg_with_potential_tool_call.tool_calls:
-            tool_call_request = ai_msg_with_potential_tool_call.tool_calls[0]
-            tool_name = tool_call_request['name']
-            tool_args = tool_call_request['args']
-
-            print(f"LANGCHAIN_DIRECT: LLM decided to use tool: {tool_name} with args: {tool_args}")
-
-            if tool_name in _tools_map:
-                tool_function = _tools_map[tool_name]
-                # 2. Execute the primary tool requested by the LLM
-                primary_tool_result_data = tool_function(**tool_args)
-                
-                
-                tool_response_content_dict = {"primary_tool_output": primary_tool_result_data}
-
-                # 3. Rudimentary RCA: If high CPU/Memory metric, also fetch error logs
-                is_critical_metric_tool = tool_name == "GetAWSMetric"
-                metric_name_from_args = tool_args.get("metric_name","").upper() if is_critical_metric_tool else ""
-                is_critical_metric_type = "CPU" in metric_name_from_args or "MEMORY" in metric_name_from_args
-                
-                metric_is_high = False
-                if is_critical_metric_tool and is_critical_metric_type and \
-                   isinstance(primary_tool_result_data, dict) and "Values" in primary_tool_result_data and primary_tool_result_data["Values"]:
-                    numeric_values = [v for v in primary_tool_result_data["Values"] if isinstance(v, (int, float))]
-                    if numeric_values:
-                        avg_value = sum(numeric_values) / len(numeric_values)
-                        if ("CPU" in metric_name_from_args and avg_value > 80) or \
-                           ("MEMORY" in metric_name_from_args and avg_value > 85):
-                            metric_is_high = True
-                
-                if metric_is_high:
-                    print(f"LANGCHAIN_DIRECT: High critical metric for {tool_args.get('service_name')}. Fetching error logs for RCA.")
-                    try:
-                        error_log_args = {
-                            "service_or_log_group_name": tool_args.get("service_name"),
-                            "time_range_str": tool_args.get("time_range_str", "last hour"),
-                            "filter_pattern": "ERROR OR Exception OR Timeout OR OOM OR Fail",
-                            "limit": 10 
-                        }
-                        rca_error_logs_data = tool_get_aws_logs(**error_log_args)
-                        # Add RCA data to the *content* of the single ToolMessage
-                        tool_response_content_dict["rca_error_logs_output"] = rca_error_logs_data
-                    except Exception as rca_e:
-                        print(f"LANGCHAIN_DIRECT: Error during implicit RCA log fetch: {rca_e}")
-                        tool_response_content_dict["rca_error_logs_output"] = {"error": f"Failed to fetch RCA logs: {str(rca_e)}"}
-                
-                # 4. Create the single ToolMessage responding to the LLM's tool_call_request
-                tool_response_message = ToolMessage(
-                    content=json.dumps(tool_response_content_dict), 
-                    tool_call_id=tool_call_request['id']
-                )
-                
-                messages_for_final_summary.append(tool_response_message)
-
-                # 5. Get final summarization from LLM
-                print("LANGCHAIN_DIRECT: Sending combined tool result(s) back to LLM for final summarization.")
-                final_ai_msg_summary = llm_with_tools.invoke(messages_for_final_summary) 
-                
-                # Update persistent history
-                _conversation_history.append(HumanMessage(content=user_query))
-                _conversation_history.append(ai_msg_with_potential_tool_call)
-                _conversation_history.append(tool_response_message)
-                _conversation_history.append(final_ai_msg_summary)
-
-                text_summary = final_ai_msg_summary.content if isinstance(final_ai_msg_summary.content, str) else json.dumps(final_ai_msg_summary.content)
-                
-                script_suggestion = None
-                if tool_name == "SuggestScalingAction" and isinstance(primary_tool_result_data, dict) and "script_suggestion" in primary_tool_result_data:
-                    script_suggestion = primary_tool_result_data["script_suggestion"]
-
-                return {
-                    "text_summary": text_summary,
-                    "data_for_display": primary_tool_result_data,
-                    "tool_used": tool_name,
-                    "script_suggestion": script_suggestion
-                }
-            else: 
-                error_text = f"LLM suggested an unknown tool: {tool_name}"
-                _conversation_history.append(HumanMessage(content=user_query))
-                _conversation_history.append(ai_msg_with_potential_tool_call)
-                _conversation_history.append(AIMessage(content=error_text))
-                return {"text_summary": error_text, "data_for_display": None, "tool_used": tool_name, "script_suggestion": None}
-        
-        else: # No tool call, LLM responded directly
+        if not getattr(ai_msg_with_potential_tool_call, "tool_calls", None): # No tool call, LLM responded directly
             text_summary = ai_msg_with_potential_tool_call.content if isinstance(ai_msg_with_potential_tool_call.content, str) else json.dumps(ai_msg_with_potential_tool_call.content)
             _conversation_history.append(HumanMessage(content=user_query))
             _conversation_history.append(ai_msg_with_potential_tool_call) 
             return {"text_summary": text_summary, "data_for_display": None, "tool_used": None, "script_suggestion": None}
 
+        turn_messages = []  # AIMessages with tool calls and their ToolMessages, in order
+        executed_calls = []  # {"iteration", "name", "args", "content", "reused"} per answered tool call
+        tool_call_memo = {}
+        iteration = 0
+        stop_reason = None
+        final_ai_msg_summary = None
+        response_mode = "llm"
+        next_ai_msg = ai_msg_with_potential_tool_call
+
+        while final_ai_msg_summary is None:
+            iteration += 1
+            tool_calls = next_ai_msg.tool_calls
+            print(f"LANGCHAIN_DIRECT: Iteration {iteration}: running {len(tool_calls)} tool call(s): "
+                  f"{[(c['name'], c.get('args')) for c in tool_calls]}")
+            try:
+                with telemetry.span("agent", "tool_wave", iteration=iteration, calls=len(tool_calls)):
+                    wave_results = _run_tool_wave(tool_calls, tool_call_memo)
+            except deadline.DeadlineExceeded:
+                if not executed_calls:
+                    raise
+                # Answer from the earlier waves; this wave's request is left out of the history.
+                stop_reason = "deadline"
+                break
+            turn_messages.append(next_ai_msg)
+            for tool_call, (content, reused) in zip(tool_calls, wave_results):
+                turn_messages.append(ToolMessage(content=json.dumps(content, default=compact_data.json_default),
+                                                 tool_call_id=tool_call["id"]))
+                executed_calls.append({"iteration": iteration, "name": tool_call["name"], "args": tool_call.get("args") or {},
+                                       "content": content, "reused": reused})
+
+            # A single tool with ready-to-display output answers the turn directly from its template
+            if iteration == 1 and len(executed_calls) == 1 and _TOOL_RESPONSE_POLICIES.get(executed_calls[0]["name"], "llm") == "template":
+                templated_text = _render_tool_response_template(executed_calls[0]["name"], executed_calls[0]["content"]["primary_tool_output"])
+                if templated_text:
+                    print(f"LANGCHAIN_DIRECT: Rendering {executed_calls[0]['name']} result from template; skipping LLM summarization.")
+                    final_ai_msg_summary = AIMessage(content=templated_text)
+                    response_mode = "template"
+                    break
+
+            # Send the results back: the LLM either answers or asks for the next wave
+            # (reused when the same decision produced identical tool output before).
+            summary_cache_key = None
+            next_ai_msg = None
+            if decision_cache_key:
+                summary_cache_key = response_cache.summary_key(
+                    decision_cache_key, [(c["name"], c["args"]) for c in executed_calls], [c["content"] for c in executed_calls])
+                next_ai_msg = _replayable(response_cache.summaries.get(summary_cache_key))
+            if next_ai_msg is not None:
+                print("LANGCHAIN_DIRECT: Tool output unchanged since a cached answer; reusing its next step.")
+            else:
+                print("LANGCHAIN_DIRECT: Sending combined tool result(s) back to LLM for the next step or final summarization.")
+                try:
+                    summary_tier = (config.LLM_ANALYSIS_TIER if _needs_analysis_tier(user_query, [c["content"] for c in executed_calls])
+                                    else config.LLM_SUMMARY_TIER)
+                    next_ai_msg = _invoke_llm(summary_tier, current_turn_messages_for_llm_decision + turn_messages, "summary")
+                    tokens_used += _llm_tokens(next_ai_msg)
+                    if summary_cache_key:
+                        response_cache.summaries.put(summary_cache_key, next_ai_msg)
+                except deadline.DeadlineExceeded:
+                    stop_reason = "deadline"
+                    break
+
+            if not getattr(next_ai_msg, "tool_calls", None):
+                final_ai_msg_summary = next_ai_msg
+                break
+            stop_reason = _loop_stop_reason(iteration, tokens_used, loop_started)
+            if stop_reason:
+                break
+
+        if stop_reason == "deadline":
+            # Degrade to a partial answer: the data was fetched, only the analysis is missing.
+            print(f"LANGCHAIN_DIRECT: Deadline reached after {iteration} iteration(s). Returning tool output without LLM summary.")
+            fetched_tools = ", ".join(sorted({c["name"] for c in executed_calls}))
+            final_ai_msg_summary = AIMessage(content=(
+                f"I retrieved the {fetched_tools} results but ran out of time to analyse them. "
+                "The raw results are shown below; ask again for a full analysis."))
+            response_mode = "partial"
+        elif stop_reason:
+            print(f"LANGCHAIN_DIRECT: Agent loop stopped by its {stop_reason} cap after {iteration} iteration(s); asking for the final answer.")
+            try:
+                final_ai_msg_summary = _invoke_llm(config.LLM_SUMMARY_TIER, current_turn_messages_for_llm_decision + turn_messages + [
+                    HumanMessage(content="(Step limit reached. Answer my question now using only the tool results above; do not call more tools.)")
+                ], "summary")
+            except deadline.DeadlineExceeded as deadline_e:
+                print(f"LANGCHAIN_DIRECT: {deadline_e}")
+            if final_ai_msg_summary is None or getattr(final_ai_msg_summary, "tool_calls", None) or not final_ai_msg_summary.content:
+                final_ai_msg_summary = AIMessage(content=(
+                    f"I gathered data in {iteration} step(s) but reached the step limit before finishing the analysis. "
+                    "The latest results are shown below; ask a narrower follow-up question to continue."))
+                response_mode = "partial"
+        if stop_reason:
+            telemetry.increment("sre_agent_agent_loop_stops_total", "Agent loops ended by a cap before the LLM answered.",
+                                reason=stop_reason)
+
+        display_calls = _display_calls(executed_calls)
+        tool_name = display_calls[-1]["name"]
+        telemetry.increment("sre_agent_final_answers_total", "Final answers by tool and how they were produced.",
+                            tool=tool_name, mode=response_mode)
+        
+        # Large tool output is kept once in the artifact store; the UI and the history only reference it
+        displays = [{"tool_used": call["name"], "data_for_display": artifact_store.offload(call["content"]["primary_tool_output"])}
+                    for call in display_calls]
+        data_for_display = displays[-1]["data_for_display"]
+
+        # Update persistent history
+        _conversation_history.append(HumanMessage(content=user_query))
+        answered_calls = iter(executed_calls)
+        for message in turn_messages:
+            if isinstance(message, ToolMessage):
+                output_ref = artifact_store.offload(next(answered_calls)["content"]["primary_tool_output"])
+                message = ToolMessage(content=artifact_store.compact_tool_content(message.content, output_ref),
+                                      tool_call_id=message.tool_call_id)
+            _conversation_history.append(message)
+        _conversation_history.append(final_ai_msg_summary)
+
+        text_summary = final_ai_msg_summary.content if isinstance(final_ai_msg_summary.content, str) else json.dumps(final_ai_msg_summary.content)
+        
+        script_suggestion = None
+        for call in executed_calls:
+            call_output = call["content"]["primary_tool_output"]
+            if call["name"] == "SuggestScalingAction" and isinstance(call_output, dict) and "script_suggestion" in call_output:
+                script_suggestion = call_output["script_suggestion"]
+
+        return {
+            "text_summary": text_summary,
+            "data_for_display": data_for_display,
+            "tool_used": tool_name,
+            "displays": displays,
+            "script_suggestion": script_suggestion,
+            "response_mode": response_mode,
+            "agent_steps": [{"iteration": c["iteration"], "tool": c["name"], "args": c["args"], "reused": c["reused"]}
+                            for c in executed_calls],
+        }
+
+    except deadline.DeadlineExceeded as e:
+        print(f"LANGCHAIN_DIRECT: Turn stopped: {e}")
+        telemetry.increment("sre_agent_turns_timed_out_total", "Turns that hit their deadline or were cancelled.")
+        _conversation_history.append(HumanMessage(content=user_query))
+        _conversation_history.append(AIMessage(content=f"(No answer: {e})"))
+        return {"text_summary": f"Sorry, I couldn't finish this request in time. {e}", "data_for_display": None, "tool_used": None, "script_suggestion": None}
     except Exception as e:
         print(f"LANGCHAIN_DIRECT: Error during LLM invocation or tool execution: {str(e)}")
         import traceback
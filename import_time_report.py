@@ -0,0 +1,54 @@
+# import_time_report.py
+# Measures how long the app's modules (and the heavy third-party modules they can pull in) take to import,
+# each in a fresh interpreter, using CPython's `-X importtime` instrumentation.
+#
+#   python import_time_report.py            # default module list
+#   python import_time_report.py boto3 gemini_agent
+
+import subprocess
+import sys
+
+DEFAULT_MODULES = [
+    "config", "telemetry", "aws_utils", "plotting_utils", "gemini_agent",
+    "streamlit", "langchain_google_genai", "langchain_core.messages", "boto3", "requests", "plotly.graph_objects", "pandas",
+]
+
+def measure_import(module_name):
+    """
+    Imports `module_name` in a fresh interpreter.
+    Returns (cumulative_microseconds, heavy_modules_loaded, error) where heavy_modules_loaded lists which of the
+    expensive dependencies ended up in sys.modules as a side effect.
+    """
+    probe = (
+        f"import {module_name}, sys; "
+        "heavy = ['langchain_google_genai', 'langchain_core', 'boto3', 'botocore', 'requests', 'plotly', 'pandas']; "
+        "print(','.join(h for h in heavy if h in sys.modules))"
+    )
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", probe], capture_output=True, text=True)
+    if proc.returncode != 0:
+        last_line = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "unknown error"
+        return None, [], last_line
+    cumulative_us = 0
+    for line in proc.stderr.splitlines():
+        # Format: "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = [p.strip() for p in line[len("import time:"):].split("|")]
+        if len(parts) == 3 and parts[2].strip() == module_name and parts[1].isdigit():
+            cumulative_us = int(parts[1])
+    heavy_loaded = [m for m in proc.stdout.strip().split(",") if m]
+    return cumulative_us, heavy_loaded, None
+
+def main(argv):
+    modules = argv or DEFAULT_MODULES
+    print(f"{'module':<28} {'import ms':>10}  heavy deps loaded as a side effect")
+    print("-" * 80)
+    for module_name in modules:
+        cumulative_us, heavy_loaded, error = measure_import(module_name)
+        if error:
+            print(f"{module_name:<28} {'n/a':>10}  ({error})")
+        else:
+            print(f"{module_name:<28} {cumulative_us / 1000:>10.1f}  {', '.join(heavy_loaded) or '-'}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,12 +1,39 @@
+import ast
 import json
+import math
 import random
 import datetime
+import re
 import time
 import uuid
 
-def generate_metric_data(service_name, metric_name, start_time_iso, end_time_iso, period_seconds=300):
+def generate_metric_value(service_name, metric_name):
+    val = 0.0
+    if "CPU" in metric_name.upper():
+        if "high-load-service" in service_name:
+            val = round(random.uniform(75.0, 95.0), 2)
+        elif "spiky-service" in service_name and random.random() < 0.3:
+             val = round(random.uniform(60.0, 90.0), 2)
+        else:
+            val = round(random.uniform(10.0, 40.0), 2)
+    elif "Memory" in metric_name.upper():
+        val = round(random.uniform(40.0, 75.0), 2)
+    elif "NetworkIn" in metric_name or "NetworkOut" in metric_name:
+        val = round(random.uniform(100000.0, 5000000.0), 0)
+    elif "Disk" in metric_name:
+        val = round(random.uniform(10.0, 200.0), 0)
+    elif "DatabaseConnections" in metric_name:
+        val = round(random.uniform(5.0, 50.0), 0)
+    elif "Invocations" in metric_name:
+        val = round(random.uniform(100.0, 1000.0), 0)
+    elif "Errors" in metric_name:
+         val = round(random.uniform(0.0, 5.0), 0)
+    else:
+        val = round(random.uniform(0.0, 100.0), 2)
+    return val
+
+def generate_metric_timestamps(start_time_iso, end_time_iso, period_seconds=300):
     timestamps = []
-    values = []
     try:
         start_dt = datetime.datetime.fromisoformat(start_time_iso.replace("Z", "+00:00"))
         end_dt = datetime.datetime.fromisoformat(end_time_iso.replace("Z", "+00:00"))
@@ -18,39 +45,130 @@ def generate_metric_data(service_name, metric_name, start_time_iso, end_time_iso
 
     while current_dt <= end_dt:
         timestamps.append(current_dt.isoformat(timespec='seconds'))
-        
-        val = 0.0
-        if "CPU" in metric_name.upper():
-            if "high-load-service" in service_name:
-                val = round(random.uniform(75.0, 95.0), 2)
-            elif "spiky-service" in service_name and random.random() < 0.3:
-                 val = round(random.uniform(60.0, 90.0), 2)
-            else:
-                val = round(random.uniform(10.0, 40.0), 2)
-        elif "Memory" in metric_name.upper():
-            val = round(random.uniform(40.0, 75.0), 2)
-        elif "NetworkIn" in metric_name or "NetworkOut" in metric_name:
-            val = round(random.uniform(100000.0, 5000000.0), 0)
-        elif "Disk" in metric_name:
-            val = round(random.uniform(10.0, 200.0), 0)
-        elif "DatabaseConnections" in metric_name:
-            val = round(random.uniform(5.0, 50.0), 0)
-        elif "Invocations" in metric_name:
-            val = round(random.uniform(100.0, 1000.0), 0)
-        elif "Errors" in metric_name:
-             val = round(random.uniform(0.0, 5.0), 0)
-        else:
-            val = round(random.uniform(0.0, 100.0), 2)
-        values.append(val)
-        
         if period_delta.total_seconds() == 0:
             break
         current_dt += period_delta
         if len(timestamps) > 1000:
             break
-            
+    return timestamps
+
+def generate_metric_data(service_name, metric_name, start_time_iso, end_time_iso, period_seconds=300):
+    timestamps = generate_metric_timestamps(start_time_iso, end_time_iso, period_seconds)
+    values = [generate_metric_value(service_name, metric_name) for _ in timestamps]
     return {"Timestamps": timestamps, "Values": values, "Label": metric_name, "Service": service_name}
 
+
+# --- Multiple statistics, percentiles and metric math (mirrors what CloudWatch GetMetricData evaluates server-side) ---
+
+SAMPLES_PER_PERIOD = 12
+_PERCENTILE_RE = re.compile(r"^p(\d{1,2}(?:\.\d+)?)$")
+_STAT_NAMES = ("Average", "Sum", "Minimum", "Maximum", "SampleCount")
+_STAT_SUFFIX_RE = re.compile(r"^(.+)_(Average|Sum|Minimum|Maximum|SampleCount|p\d{1,2}(?:\.\d+)?)$")
+
+def compute_statistic(samples, statistic):
+    if not samples:
+        return None
+    if statistic == "Average":
+        return round(sum(samples) / len(samples), 4)
+    if statistic == "Sum":
+        return round(sum(samples), 4)
+    if statistic == "Minimum":
+        return min(samples)
+    if statistic == "Maximum":
+        return max(samples)
+    if statistic == "SampleCount":
+        return float(len(samples))
+    percentile_match = _PERCENTILE_RE.match(statistic)
+    if percentile_match:
+        ordered = sorted(samples)
+        rank = max(1, math.ceil(float(percentile_match.group(1)) / 100.0 * len(ordered)))  # nearest-rank
+        return ordered[rank - 1]
+    raise ValueError(f"Unsupported statistic '{statistic}'. Use one of {', '.join(_STAT_NAMES)} or a percentile like 'p99'.")
+
+def split_metric_reference(identifier, default_statistic):
+    """'Errors_Sum' -> ('Errors', 'Sum'); 'Errors' -> ('Errors', default_statistic)."""
+    suffix_match = _STAT_SUFFIX_RE.match(identifier)
+    if suffix_match:
+        return suffix_match.group(1), suffix_match.group(2)
+    return identifier, default_statistic
+
+def evaluate_metric_expression(expression, resolve_series):
+    """
+    Evaluates an arithmetic metric-math expression ('100 * Errors_Sum / Invocations_Sum') point by point.
+    `resolve_series(identifier)` returns the list of values for a metric reference. Points where an
+    operand is missing or a division by zero occurs are None (CloudWatch drops them as well).
+    """
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Invalid metric expression '{expression}': {e.msg}")
+
+    def _eval(node, i):
+        if isinstance(node, ast.Expression):
+            return _eval(node.body, i)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return float(node.value)
+        if isinstance(node, ast.Name):
+            return resolve_series(node.id)[i]
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            operand = _eval(node.operand, i)
+            return None if operand is None else (-operand if isinstance(node.op, ast.USub) else operand)
+        if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub, ast.Mult, ast.Div)):
+            left, right = _eval(node.left, i), _eval(node.right, i)
+            if left is None or right is None:
+                return None
+            if isinstance(node.op, ast.Add): return left + right
+            if isinstance(node.op, ast.Sub): return left - right
+            if isinstance(node.op, ast.Mult): return left * right
+            return None if right == 0 else left / right
+        raise ValueError(f"Unsupported element in metric expression '{expression}': only numbers, metric names, + - * / and parentheses are allowed.")
+
+    length = None
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            length = len(resolve_series(node.id))
+            break
+    if length is None:
+        raise ValueError(f"Metric expression '{expression}' does not reference any metric.")
+    values = []
+    for i in range(length):
+        value = _eval(tree, i)
+        values.append(None if value is None else round(value, 4))
+    return values
+
+def generate_metric_statistics(service_name, metric_name, start_time_iso, end_time_iso, period_seconds,
+                               statistics, expressions):
+    """
+    Returns {"Series": [{"Timestamps", "Values", "Label"}, ...]} with one series per requested statistic of
+    `metric_name` and one per metric-math expression ("Label=expression" or just "expression").
+    Each period is simulated from SAMPLES_PER_PERIOD raw samples so statistics are mutually consistent.
+    """
+    timestamps = generate_metric_timestamps(start_time_iso, end_time_iso, period_seconds)
+    raw_samples = {}  # metric name -> per-period sample lists
+
+    def _samples(name):
+        if name not in raw_samples:
+            raw_samples[name] = [[generate_metric_value(service_name, name) for _ in range(SAMPLES_PER_PERIOD)]
+                                 for _ in timestamps]
+        return raw_samples[name]
+
+    stat_series = {}  # (metric, statistic) -> values
+
+    def _series(name, statistic):
+        if (name, statistic) not in stat_series:
+            stat_series[(name, statistic)] = [compute_statistic(samples, statistic) for samples in _samples(name)]
+        return stat_series[(name, statistic)]
+
+    default_statistic = statistics[0] if statistics else "Average"
+    series = []
+    for statistic in statistics:
+        series.append({"Timestamps": timestamps, "Values": _series(metric_name, statistic), "Label": f"{metric_name} ({statistic})"})
+    for expression in expressions:
+        label, _, body = expression.partition("=") if "=" in expression else (expression, "", expression)
+        values = evaluate_metric_expression(body.strip(), lambda identifier: _series(*split_metric_reference(identifier, default_statistic)))
+        series.append({"Timestamps": timestamps, "Values": values, "Label": label.strip()})
+    return {"Series": series, "Label": metric_name, "Service": service_name}
+
 def generate_log_events(log_group_name, start_time_epoch_ms, end_time_epoch_ms, filter_pattern=""):
     events = []
     num_events = random.randint(10, 50)
@@ -119,11 +237,20 @@ def lambda_handler(event, context):
             start_time_iso = query_params.get("start_time", default_start_time.isoformat(timespec='seconds').replace("+00:00", "Z"))
             end_time_iso = query_params.get("end_time", default_end_time.isoformat(timespec='seconds').replace("+00:00", "Z"))
             period = query_params.get("period", "300")
+            statistics = [s.strip() for s in query_params.get("statistics", "").split(",") if s.strip()]
+            expressions = json.loads(query_params.get("expressions") or "[]")
 
             if not service_name or not metric_name:
                 return {"statusCode": 400, "body": json.dumps({"error": "Missing required query parameters: 'service_name' and 'metric_name'"})}
             
-            metric_data = generate_metric_data(service_name, metric_name, start_time_iso, end_time_iso, int(period))
+            if statistics or expressions:
+                metric_data = generate_metric_statistics(service_name, metric_name, start_time_iso, end_time_iso, int(period),
+                                                         statistics or ["Average"], expressions)
+                if len(statistics) == 1 and not expressions:
+                    # A single statistic keeps the plain {"Timestamps", "Values", "Label"} shape
+                    metric_data = dict(metric_data["Series"][0], Service=service_name)
+            else:
+                metric_data = generate_metric_data(service_name, metric_name, start_time_iso, end_time_iso, int(period))
             return {"statusCode": 200, "body": json.dumps(metric_data)}
 
         elif request_path == "/logs":
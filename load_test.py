@@ -0,0 +1,317 @@
+# load_test.py
+# Soak/load harness: N concurrent simulated analyst sessions replay a mix of realistic queries against
+# gemini_agent, with a stub LLM in place of Gemini and the mock Lambda's `lambda_handler` called in-process
+# in place of API Gateway. Concurrency is ramped in stages; each stage reports throughput, latency
+# percentiles, error rates and memory growth per session, and the ramp stops at the first stage that
+# breaks the latency/error SLO.
+#
+#   python load_test.py                                  # ramp 1,2,4,8,16 sessions, 5 turns each
+#   python load_test.py --concurrency 8,32,64 --duration 120 --llm-latency-ms 800
+#   python load_test.py --keep-state --duration 600       # soak: state accumulates across stages
+#
+# All sessions run in one process, like every Streamlit session of one deployment. gemini_agent's
+# conversation history (and its data-source flag) is module-global, so concurrent sessions interleave
+# their turns in one shared history. That is measured as is: the history length is reported per stage.
+
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import gc
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+
+import config
+
+# The example queries of the streamlit_app.py sidebar, plus multi-step and fleet-wide questions.
+SIDEBAR_EXAMPLE_QUERIES = [
+    "Plot CPU utilization for ec2-instance-A.",
+    "Show memory usage for ecs-service-X for the last 3 hours as a table.",
+    "Get ERROR logs for lambda-function-Y since yesterday.",
+    "What is the workload currently running?",
+    "What are the names of the services running currently?",
+    "How many nodes are running in the 'prod-cluster-asg'?",
+    "What apps are hosted on Lambda with prefix 'billing'?",
+    "CPU on high-load-service is at 88% and it's an EC2 AutoScalingGroup, suggest scaling up and tell me the root cause.",
+    "Share the CPU utilization report for rds-database-Z for today.",
+]
+EXTRA_QUERIES = [
+    "Why is high-load-service slow?",
+    "Which services have the highest CPU right now?",
+]
+
+_TIME_RANGES = ("last 15 minutes", "last 30 minutes", "last 3 hours", "last 6 hours", "last 12 hours",
+                "last 24 hours", "yesterday", "today", "last week")
+_STEP_LIMIT_MARKER = "do not call more tools"
+
+
+def _time_range(query):
+    lowered = query.lower()
+    return next((time_range for time_range in _TIME_RANGES if time_range in lowered), "last hour")
+
+def _service(query, default="ec2-instance-A"):
+    return next((name for name in config.MOCK_SERVICES if name in query), default)
+
+def _plan_tool_waves(query):
+    """The tool calls a well-behaved model would make for `query`: a list of waves, each a list of (tool, args)."""
+    lowered = query.lower()
+    service = _service(query)
+    time_range = _time_range(query)
+    if "suggest scaling" in lowered or "remediation" in lowered:
+        return [[("SuggestScalingAction", {"service_name": service, "service_type": "EC2 AutoScalingGroup",
+                                           "metric_name": "CPUUtilization",
+                                           "current_metric_value": (re.findall(r"\d+%", query) or ["90%"])[0]})]]
+    if lowered.startswith("why"):
+        return [[("GetAWSMetric", {"service_name": service, "metric_name": "CPUUtilization", "time_range_str": time_range}),
+                 ("GetAWSMetric", {"service_name": service, "metric_name": "MemoryUtilization", "time_range_str": time_range})],
+                [("GetAWSLogs", {"service_or_log_group_name": service, "time_range_str": time_range, "filter_pattern": "ERROR"})]]
+    if "highest" in lowered or "hottest" in lowered:
+        return [[("ScanFleetMetric", {"metric_name": "CPUUtilization", "time_range_str": time_range})]]
+    if "logs" in lowered:
+        return [[("GetAWSLogs", {"service_or_log_group_name": service, "time_range_str": time_range,
+                                 "filter_pattern": "ERROR" if "error" in lowered else ""})]]
+    if "nodes" in lowered:
+        return [[("GetClusterNodeCount", {"cluster_or_asg_name": (re.findall(r"'([^']+)'", query) or [""])[0]})]]
+    if "workload" in lowered:
+        return [[("GetCloudWorkloadOverview", {})]]
+    if "lambda" in lowered or "services" in lowered:
+        prefix = re.findall(r"prefix '([^']+)'", query)
+        return [[("ListRunningServices", {"service_type_filter": "Lambda" if "lambda" in lowered else "",
+                                          "application_tag_or_prefix": prefix[0] if prefix else ""})]]
+    metric_name = "MemoryUtilization" if "memory" in lowered else "CPUUtilization"
+    return [[("GetAWSMetric", {"service_name": service, "metric_name": metric_name, "time_range_str": time_range})]]
+
+
+class StubChatModel:
+    """
+    Stands in for a Gemini chat model bound to the tools (`invoke(messages) -> AIMessage`). It follows
+    `_plan_tool_waves` one wave per call, then answers; latency and token usage are simulated.
+    """
+
+    def __init__(self, tier, latency_seconds):
+        self.tier = tier
+        self.latency_seconds = latency_seconds
+
+    def invoke(self, messages):
+        from langchain_core.messages import AIMessage, HumanMessage
+        time.sleep(self.latency_seconds * random.uniform(0.5, 1.5))
+        turn_start = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+        waves_done = sum(1 for m in messages[turn_start:] if getattr(m, "tool_calls", None))
+        if _STEP_LIMIT_MARKER in messages[turn_start].content:
+            plan, waves_done = [], 0
+        else:
+            plan = _plan_tool_waves(messages[turn_start].content)
+        input_tokens = sum(len(str(m.content)) for m in messages) // 4
+        if waves_done < len(plan):
+            tool_calls = [{"name": name, "args": args, "id": f"call_{uuid.uuid4().hex[:12]}"} for name, args in plan[waves_done]]
+            response = AIMessage(content="", tool_calls=tool_calls)
+        else:
+            response = AIMessage(content=f"[{self.tier} stub] Summary of {waves_done} tool step(s) for the question.")
+        response.usage_metadata = {"input_tokens": input_tokens, "output_tokens": 60, "total_tokens": input_tokens + 60}
+        return response
+
+
+def _in_process_mock_api(backend_latency_seconds):
+    """A replacement for gemini_agent._mock_api_get that calls the mock Lambda's handler directly."""
+    import requests
+    import deadline
+    import telemetry
+    from lambda_function import lambda_handler
+
+    def _mock_api_get(path, params):
+        def _get():
+            time.sleep(backend_latency_seconds)
+            event = {"rawPath": path, "queryStringParameters": {k: str(v) for k, v in params.items()}}
+            response = lambda_handler(event, None)
+            if response["statusCode"] >= 400:
+                raise requests.HTTPError(f"{response['statusCode']} from mock API {path}: {response['body']}")
+            return json.loads(response["body"])
+
+        with telemetry.span("http", f"mock_api{path}"):
+            return deadline.hedged_call(f"mock_api{path}", _get)
+    return _mock_api_get
+
+def install_stubs(args):
+    """Points gemini_agent at the stub LLM tiers and the in-process mock API."""
+    import gemini_agent
+    if not config.GOOGLE_API_KEY:
+        config.GOOGLE_API_KEY = "load-test-stub"
+    for tier in config.LLM_MODEL_TIERS:
+        latency_ms = args.large_llm_latency_ms if tier == config.LLM_ANALYSIS_TIER else args.llm_latency_ms
+        gemini_agent._llms_with_tools[tier] = StubChatModel(tier, latency_ms / 1000)
+    gemini_agent._mock_api_get = _in_process_mock_api(args.backend_latency_ms / 1000)
+    config.RESPONSE_CACHE_ENABLED = not args.no_response_cache
+
+def reset_state():
+    import artifact_store
+    import gemini_agent
+    import response_cache
+    gemini_agent.clear_conversation_history()
+    response_cache.clear()
+    artifact_store.store.clear()
+
+
+def _classify(response_package):
+    """'ok', 'partial' (degraded but answered) or an error kind, from the package the UI would render."""
+    import artifact_store
+    text = response_package.get("text_summary") or ""
+    if text.startswith("Sorry, I couldn't finish"):
+        return "timeout"
+    if text.startswith("Sorry, an error occurred"):
+        return "agent_error"
+    data = artifact_store.resolve(response_package.get("data_for_display"))
+    if isinstance(data, dict) and "error" in data:
+        return "tool_error"
+    return "partial" if response_package.get("response_mode") == "partial" else "ok"
+
+def _render(query, response_package):
+    """Builds the table/plot the Streamlit app would show for this answer."""
+    import artifact_store
+    import compact_data
+    import plotting_utils
+    data = artifact_store.resolve(response_package.get("data_for_display"))
+    if isinstance(data, compact_data.MetricResult):
+        if "table" in query.lower():
+            plotting_utils.create_table_from_metrics(data)
+        else:
+            plotting_utils.create_time_series_plot(data)
+    elif isinstance(data, compact_data.LogBatch):
+        plotting_utils.create_table_from_logs(data)
+
+def run_session(session_id, queries, args, stop_at, records, records_lock):
+    """One simulated analyst: asks queries from the mix one after the other, with think time in between."""
+    import gemini_agent
+    import log_index
+    rng = random.Random(args.seed * 100003 + session_id)
+    session_log_index = log_index.SessionLogIndex(config.LOG_INDEX_MAX_EVENTS)
+    turns = 0
+    while (turns < args.turns_per_session) if stop_at is None else (time.monotonic() < stop_at):
+        query = rng.choice(queries)
+        start = time.perf_counter()
+        try:
+            response_package = gemini_agent.get_langchain_direct_tool_call_response(query, True, session_log_index=session_log_index)
+            outcome = _classify(response_package)
+            if args.render and outcome in ("ok", "partial"):
+                _render(query, response_package)
+            steps = len(response_package.get("agent_steps") or [])
+        except Exception as e:
+            outcome, steps = f"exception:{type(e).__name__}", 0
+        with records_lock:
+            records.append((time.perf_counter() - start, outcome, steps))
+        turns += 1
+        if args.think_time_ms:
+            time.sleep(rng.uniform(0.5, 1.5) * args.think_time_ms / 1000)
+
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+def run_stage(sessions, queries, args):
+    import artifact_store
+    import gemini_agent
+    if not args.keep_state:
+        reset_state()
+    gc.collect()
+    memory_before = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+
+    records = []
+    records_lock = threading.Lock()
+    stop_at = time.monotonic() + args.duration if args.duration else None
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=sessions, thread_name_prefix="load-session") as executor:
+        for future in [executor.submit(run_session, i, queries, args, stop_at, records, records_lock) for i in range(sessions)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    gc.collect()
+    memory_after, memory_peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+    latencies = sorted(latency for latency, _, _ in records)
+    outcomes = collections.Counter(outcome for _, outcome, _ in records)
+    errors = sum(count for outcome, count in outcomes.items() if outcome not in ("ok", "partial"))
+    return {
+        "sessions": sessions,
+        "turns": len(records),
+        "errors": errors,
+        "error_rate": errors / len(records) if records else 0.0,
+        "outcomes": dict(outcomes),
+        "seconds": round(elapsed, 2),
+        "turns_per_second": len(records) / elapsed if elapsed else 0.0,
+        "p50_seconds": _percentile(latencies, 0.50),
+        "p95_seconds": _percentile(latencies, 0.95),
+        "p99_seconds": _percentile(latencies, 0.99),
+        "mean_tool_calls": sum(steps for _, _, steps in records) / len(records) if records else 0.0,
+        "memory_growth_per_session_bytes": (memory_after - memory_before) / sessions,
+        "memory_peak_bytes": memory_peak,
+        "history_messages": len(gemini_agent._conversation_history),
+        "artifact_store_bytes": artifact_store.store.memory_bytes,
+    }
+
+def _print_stage(stage, out):
+    print(f"{stage['sessions']:>8} {stage['turns']:>6} {stage['error_rate'] * 100:>6.1f} {stage['turns_per_second']:>8.2f} "
+          f"{stage['p50_seconds']:>7.2f} {stage['p95_seconds']:>7.2f} {stage['p99_seconds']:>7.2f} "
+          f"{stage['memory_growth_per_session_bytes'] / 1024:>11.1f} {stage['memory_peak_bytes'] / 2**20:>9.1f} "
+          f"{stage['history_messages']:>8} {stage['artifact_store_bytes'] / 2**20:>9.1f}", file=out)
+    problems = {k: v for k, v in stage["outcomes"].items() if k != "ok"}
+    if problems:
+        print(f"{'':>8} outcomes other than ok: {problems}", file=out)
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Concurrent-session load/soak test of the agent with a stub LLM and in-process mock API.")
+    parser.add_argument("--concurrency", default="1,2,4,8,16", help="Comma-separated session counts, one stage each (default: 1,2,4,8,16)")
+    parser.add_argument("--turns-per-session", type=int, default=5, help="Turns per session and stage (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=0, help="Run each stage for this many seconds instead of a fixed number of turns")
+    parser.add_argument("--think-time-ms", type=float, default=0, help="Mean pause between a session's turns")
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="Mean latency of a fast-tier stub LLM call")
+    parser.add_argument("--large-llm-latency-ms", type=float, default=1200, help="Mean latency of an analysis-tier stub LLM call")
+    parser.add_argument("--backend-latency-ms", type=float, default=20, help="Added latency of each mock API request (network round trip)")
+    parser.add_argument("--no-response-cache", action="store_true", help="Disable the LLM response cache (every turn pays for its LLM calls)")
+    parser.add_argument("--keep-state", action="store_true", help="Don't clear history and caches between stages (soak mode)")
+    parser.add_argument("--render", action="store_true", help="Also build the tables/plots the UI would show (needs pandas and plotly)")
+    parser.add_argument("--no-memory", action="store_true", help="Skip tracemalloc (it slows allocation-heavy code down noticeably)")
+    parser.add_argument("--slo-p95-seconds", type=float, default=10.0, help="Stop the ramp after a stage whose p95 latency exceeds this")
+    parser.add_argument("--max-error-rate", type=float, default=0.05, help="Stop the ramp after a stage whose error rate exceeds this")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="Also write the stage results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the agent's and mock Lambda's console output")
+    return parser.parse_args(argv)
+
+def main(argv):
+    args = parse_args(argv)
+    random.seed(args.seed)
+    stage_sizes = [int(n) for n in args.concurrency.split(",") if n.strip()]
+    queries = SIDEBAR_EXAMPLE_QUERIES + EXTRA_QUERIES
+    install_stubs(args)
+    if not args.no_memory:
+        tracemalloc.start()
+
+    out = sys.stdout
+    print(f"{'sessions':>8} {'turns':>6} {'err%':>6} {'turns/s':>8} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} "
+          f"{'KiB/session':>11} {'peak MiB':>9} {'history':>8} {'store MiB':>9}", file=out)
+    print("-" * 100, file=out)
+    results = []
+    with open(os.devnull, "w") as devnull:
+        for sessions in stage_sizes:
+            with contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+                stage = run_stage(sessions, queries, args)
+            results.append(stage)
+            _print_stage(stage, out)
+            if stage["p95_seconds"] > args.slo_p95_seconds or stage["error_rate"] > args.max_error_rate:
+                print(f"Scaling limit: at {sessions} concurrent sessions p95 is {stage['p95_seconds']:.2f}s "
+                      f"and the error rate {stage['error_rate'] * 100:.1f}% (SLO: p95 <= {args.slo_p95_seconds}s, "
+                      f"errors <= {args.max_error_rate * 100:.1f}%).", file=out)
+                break
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "stages": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
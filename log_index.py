@@ -0,0 +1,262 @@
+# log_index.py
+# Keeps the log events fetched during a session in a small inverted index so that drill-down queries
+# ("ERROR logs" -> "ERROR ... DB_CONN_TIMEOUT" -> "... TransactionID=abc123") over an already covered
+# time window are answered locally; only time ranges that were never fetched go to the backend.
+
+import bisect
+import collections
+import contextlib
+import contextvars
+import re
+import threading
+from array import array
+
+import compact_data
+import telemetry
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_MAX_GAP_REQUESTS = 3 # More uncovered gaps than this and the whole window is fetched in one request
+
+# Filter semantics of the two backends:
+#   "substring"  - the mock API: the whole pattern is a case-insensitive substring of the message
+#   "cloudwatch" - CloudWatch Logs unstructured terms: every term (or "quoted phrase") must appear, case-sensitive
+MATCH_SUBSTRING = "substring"
+MATCH_CLOUDWATCH = "cloudwatch"
+
+
+def _cloudwatch_terms(filter_pattern):
+    """Terms of a simple CloudWatch pattern, or None for syntax the index doesn't model (JSON, ?OR, -exclusion, regex)."""
+    pattern = filter_pattern.strip()
+    if pattern.startswith(("{", "[", "%")):
+        return None
+    terms = []
+    for quoted, bare in re.findall(r'"([^"]*)"|(\S+)', pattern):
+        term = quoted if quoted else bare
+        if not quoted and term[0] in "?-":
+            return None
+        if term:
+            terms.append(term)
+    return terms
+
+def _pattern_parts(filter_pattern, match_mode):
+    """The substrings a matching message must contain, or None when the pattern can't be evaluated locally."""
+    if match_mode == MATCH_SUBSTRING:
+        return [filter_pattern.lower()] if filter_pattern else []
+    return _cloudwatch_terms(filter_pattern)
+
+def _message_matches(message, parts, match_mode):
+    haystack = message.lower() if match_mode == MATCH_SUBSTRING else message
+    return all(part in haystack for part in parts)
+
+def _subsumes(broader_parts, narrower_parts, match_mode):
+    """True if every message matching `narrower_parts` necessarily matches `broader_parts`."""
+    if not broader_parts:
+        return True
+    if match_mode == MATCH_SUBSTRING:
+        return bool(narrower_parts) and broader_parts[0] in narrower_parts[0]
+    return set(broader_parts) <= set(narrower_parts)
+
+def _merge_intervals(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def _uncovered(start, end, covered):
+    """Sub-ranges of [start, end] not inside any of the merged `covered` intervals."""
+    gaps = []
+    cursor = start
+    for covered_start, covered_end in covered:
+        if covered_end < cursor or covered_start > end:
+            continue
+        if covered_start > cursor:
+            gaps.append((cursor, covered_start))
+        cursor = max(cursor, covered_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+class LogGroupIndex:
+    """Events of one log group: token -> posting list of event offsets, plus offsets ordered by timestamp."""
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self.events = compact_data.LogBatch()
+        self._event_keys = set()
+        self._postings = collections.defaultdict(lambda: array("I"))
+        self._sorted_timestamps = []
+        self._sorted_offsets = []
+        self.coverage = {}  # normalized pattern parts (tuple) -> merged [start_ms, end_ms] intervals fetched completely
+
+    def add_events(self, batch):
+        added = 0
+        for i in range(len(batch)):
+            key = batch.key(i)
+            if key in self._event_keys:
+                continue
+            self._event_keys.add(key)
+            offset = len(self.events)
+            self.events.append_from(batch, i)
+            for token in set(_TOKEN_RE.findall(batch.messages[i].lower())):
+                self._postings[token].append(offset)
+            position = bisect.bisect_right(self._sorted_timestamps, batch.timestamps[i])
+            self._sorted_timestamps.insert(position, batch.timestamps[i])
+            self._sorted_offsets.insert(position, offset)
+            added += 1
+        return added
+
+    def trim_oldest(self, max_events):
+        """
+        Keeps only the newest `max_events` events; the time before them is no longer counted as covered,
+        so a later query there goes to the backend again. Returns the number of events dropped.
+        """
+        dropped = len(self._sorted_offsets) - max_events
+        if dropped <= 0:
+            return 0
+        cutoff_ms = self._sorted_timestamps[dropped - 1]
+        kept = self.events.take(self._sorted_offsets[dropped:])
+        coverage = self.coverage
+        self._reset()
+        self.add_events(kept)
+        for parts, intervals in coverage.items():
+            clipped = [[max(start, cutoff_ms + 1), end] for start, end in intervals if end > cutoff_ms]
+            if clipped:
+                self.coverage[parts] = clipped
+        return dropped
+
+    def record_coverage(self, parts, start_ms, end_ms):
+        key = tuple(parts)
+        self.coverage[key] = _merge_intervals(self.coverage.get(key, []) + [[start_ms, end_ms]])
+
+    def covered_intervals(self, parts, match_mode):
+        """Everything fetched completely with this pattern or any broader one."""
+        intervals = []
+        for covered_parts, covered in self.coverage.items():
+            if _subsumes(list(covered_parts), parts, match_mode):
+                intervals.extend(covered)
+        return _merge_intervals(intervals)
+
+    def _candidate_offsets(self, parts):
+        """Offsets that can possibly match: every pattern token must occur inside some token of the message."""
+        candidates = None
+        for part in parts:
+            for token in _TOKEN_RE.findall(part.lower()):
+                token_offsets = set()
+                for vocabulary_token, postings in self._postings.items():
+                    if token in vocabulary_token:
+                        token_offsets.update(postings)
+                candidates = token_offsets if candidates is None else candidates & token_offsets
+                if not candidates:
+                    return set()
+        return candidates
+
+    def search(self, start_ms, end_ms, parts, match_mode, limit):
+        """Matching events in [start_ms, end_ms], oldest first, at most `limit`, as a LogBatch."""
+        lo = bisect.bisect_left(self._sorted_timestamps, start_ms)
+        hi = bisect.bisect_right(self._sorted_timestamps, end_ms)
+        candidates = self._candidate_offsets(parts) if parts else None
+        matches = []
+        for offset in self._sorted_offsets[lo:hi]:
+            if candidates is not None and offset not in candidates:
+                continue
+            if _message_matches(self.events.messages[offset], parts, match_mode):
+                matches.append(offset)
+                if len(matches) >= limit:
+                    break
+        return self.events.take(matches)
+
+
+class SessionLogIndex:
+    """
+    One user session's log index across log groups, bounded by a total event budget: the least recently used
+    group is dropped first, and a single group over the budget loses its oldest events. Each session owns
+    one (e.g. in st.session_state) and makes it current with `scope`.
+    """
+
+    def __init__(self, max_events):
+        self.max_events = max_events
+        self._groups = collections.OrderedDict()  # (match_mode, log_group) -> LogGroupIndex
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._groups.clear()
+
+    def _group(self, match_mode, log_group_name):
+        key = (match_mode, log_group_name)
+        if key not in self._groups:
+            self._groups[key] = LogGroupIndex()
+        self._groups.move_to_end(key)
+        return self._groups[key]
+
+    def _enforce_budget(self):
+        while len(self._groups) > 1 and sum(len(g.events) for g in self._groups.values()) > self.max_events:
+            evicted_key, _ = self._groups.popitem(last=False)
+            print(f"LOG_INDEX: Evicted log group '{evicted_key[1]}' to stay within {self.max_events} indexed events.")
+        if self._groups:
+            (_, log_group_name), group = next(reversed(self._groups.items()))
+            dropped = group.trim_oldest(self.max_events)
+            if dropped:
+                print(f"LOG_INDEX: Dropped the {dropped} oldest event(s) of '{log_group_name}' to stay within "
+                      f"{self.max_events} indexed events.")
+
+    def query(self, log_group_name, start_ms, end_ms, filter_pattern, limit, fetch_window, match_mode):
+        """
+        Returns a compact_data.LogBatch like the backend would, or the backend's {"error": ...}.
+        `fetch_window(start_ms, end_ms)` performs a real backend request and returns a LogBatch or {"error": ...};
+        it is only called for sub-ranges not already covered by this or a broader pattern.
+        """
+        parts = _pattern_parts(filter_pattern, match_mode)
+        if parts is None:  # Pattern syntax we can't evaluate locally: always ask the backend
+            return fetch_window(start_ms, end_ms)
+
+        with self._lock:
+            group = self._group(match_mode, log_group_name)
+            gaps = _uncovered(start_ms, end_ms, group.covered_intervals(parts, match_mode))
+        if len(gaps) > _MAX_GAP_REQUESTS:
+            gaps = [(start_ms, end_ms)]
+
+        fetched_events = 0
+        for gap_start, gap_end in gaps:
+            result = fetch_window(gap_start, gap_end)
+            if compact_data.is_error(result):
+                return result
+            with self._lock:
+                fetched_events += group.add_events(result)
+                # Only a complete answer proves there's nothing else in the gap for this pattern.
+                if result.complete if result.complete is not None else len(result) < limit:
+                    group.record_coverage(parts, gap_start, gap_end)
+
+        with self._lock:
+            events = group.search(start_ms, end_ms, parts, match_mode, limit)
+            self._enforce_budget()
+
+        source = "local" if not gaps else ("backend" if gaps == [(start_ms, end_ms)] else "partial")
+        telemetry.increment("sre_agent_log_index_queries_total", "Log queries by how they were answered.", source=source)
+        print(f"LOG_INDEX: '{log_group_name}' filter='{filter_pattern}' answered {source} "
+              f"({len(gaps)} backend request(s), {fetched_events} new event(s) indexed).")
+        return events
+
+
+_current_index = contextvars.ContextVar("sre_agent_log_index", default=None)
+
+def current():
+    """The log index of the session whose turn is running, or None (logs are then always fetched)."""
+    return _current_index.get()
+
+@contextlib.contextmanager
+def scope(session_index):
+    """Makes `session_index` current for the block (and for work submitted from it with its context)."""
+    token = _current_index.set(session_index)
+    try:
+        yield session_index
+    finally:
+        _current_index.reset(token)
@@ -0,0 +1,89 @@
+# log_tail.py
+import collections
+import time
+
+import compact_data
+import config
+import plotting_utils
+import telemetry
+
+
+class LogTailer:
+    """
+    Follows one log group by polling from a high-water-mark timestamp.
+
+    `fetch_events(start_ms, end_ms, limit)` performs one backend request and returns a compact_data.LogBatch
+    or {"error": ...}. Each poll re-reads the last `overlap_seconds` so late-ingested CloudWatch events
+    are picked up, and drops events it has already shown by event ID.
+    New events are formatted once and appended to a bounded buffer of table rows.
+
+    Backpressure: a poll reads at most LOG_TAIL_MAX_EVENTS_PER_POLL events and continues from the last
+    one next time; if the tail falls more than LOG_TAIL_MAX_LAG_SECONDS behind it skips ahead to now.
+    The buffer keeps the newest LOG_TAIL_BUFFER_EVENTS rows. Both are counted rather than hidden.
+    """
+
+    def __init__(self, log_group_name, filter_pattern, fetch_events, overlap_seconds=None):
+        self.log_group_name = log_group_name
+        self.filter_pattern = filter_pattern
+        self._fetch_events = fetch_events
+        self._overlap_ms = int((config.LOG_TAIL_OVERLAP_SECONDS if overlap_seconds is None else overlap_seconds) * 1000)
+        self.high_water_mark_ms = int(time.time() * 1000) - config.LOG_TAIL_INITIAL_LOOKBACK_SECONDS * 1000
+        self.rows = collections.deque(maxlen=config.LOG_TAIL_BUFFER_EVENTS)
+        self._recent_keys = {}  # event key -> timestamp, for events that the overlap window can return again
+        self.lagging = False
+        self.dropped_events = 0  # Rows pushed out of the buffer by newer ones
+        self.skipped_seconds = 0.0  # Time ranges never read because the group produced events faster than we poll
+        self.polls = 0
+        self.last_error = None
+
+    def poll(self, now_ms=None):
+        """Fetches events since the high-water mark, appends the new ones and returns their rows."""
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        limit = config.LOG_TAIL_MAX_EVENTS_PER_POLL
+        # While catching up, continue exactly where the last (truncated) read stopped.
+        start_ms = self.high_water_mark_ms if self.lagging else max(0, self.high_water_mark_ms - self._overlap_ms)
+        self.polls += 1
+
+        with telemetry.span("tail", "logs.poll", log_group_name=self.log_group_name):
+            result = self._fetch_events(start_ms, now_ms, limit)
+        if compact_data.is_error(result):
+            self.last_error = result["error"]
+            return []
+        self.last_error = None
+
+        order = sorted(range(len(result)), key=result.timestamps.__getitem__)
+        truncated = len(order) >= limit or result.complete is False
+        order = order[:limit]
+
+        new_rows = []
+        for i in order:
+            key = result.key(i)
+            if key in self._recent_keys:
+                continue
+            self._recent_keys[key] = result.timestamps[i]
+            new_rows.append(plotting_utils.format_log_row(result.timestamps[i], result.stream_name(i), result.messages[i]))
+
+        if not truncated:
+            self.high_water_mark_ms = now_ms
+        elif order:
+            # Events sharing the last millisecond are re-read next time and dropped by key.
+            self.high_water_mark_ms = max(self.high_water_mark_ms + 1, result.timestamps[order[-1]])
+        # else: an empty page with more behind it (CloudWatch can return one with a nextToken). The mark stays,
+        # so the window is read again next poll, or counted as skipped if the lag limit is reached first.
+        self.lagging = truncated
+        lag_ms = now_ms - self.high_water_mark_ms
+        if lag_ms > config.LOG_TAIL_MAX_LAG_SECONDS * 1000:
+            print(f"LOG_TAIL: '{self.log_group_name}' is {lag_ms / 1000:.0f}s behind; skipping ahead to now.")
+            self.skipped_seconds += lag_ms / 1000
+            self.high_water_mark_ms = now_ms
+            self.lagging = False
+
+        oldest_rereadable_ms = self.high_water_mark_ms - self._overlap_ms
+        self._recent_keys = {key: ts for key, ts in self._recent_keys.items() if ts >= oldest_rereadable_ms}
+
+        overflow = len(self.rows) + len(new_rows) - self.rows.maxlen
+        if overflow > 0:
+            self.dropped_events += overflow
+        self.rows.extend(new_rows)
+        telemetry.increment("sre_agent_log_tail_events_total", "Log events appended by live tail.", amount=len(new_rows))
+        return new_rows
@@ -0,0 +1,146 @@
+# metric_retrieval.py
+# Splits long metric ranges into datapoint-bounded windows, fetches them concurrently and stitches the
+# results back together in time order, so long high-resolution ranges are neither truncated by the
+# backend's per-request datapoint cap nor fetched one window at a time.
+
+import collections
+import concurrent.futures
+import contextvars
+import csv
+import datetime
+
+import compact_data
+import config
+
+
+def max_datapoints_per_request(use_mock_data: bool, series_count: int = 1) -> int:
+    """Datapoints one request may return per series (CloudWatch's cap is shared by every returned series)."""
+    if use_mock_data:
+        return config.METRIC_MAX_DATAPOINTS_MOCK
+    return max(1, config.METRIC_MAX_DATAPOINTS_CLOUDWATCH // max(1, series_count))
+
+def plan_metric_chunks(start_dt, end_dt, period_seconds: int, max_datapoints: int) -> list:
+    """
+    Returns [(window_start, window_end), ...] covering [start_dt, end_dt] with at most `max_datapoints`
+    period-aligned points per window (both ends inclusive). Adjacent windows share their boundary
+    timestamp, which `stitch_metric_chunks` removes again.
+    """
+    period_seconds = max(1, int(period_seconds))
+    step = datetime.timedelta(seconds=period_seconds * max(1, max_datapoints - 1))
+    windows = []
+    window_start = start_dt
+    while True:
+        window_end = min(window_start + step, end_dt)
+        windows.append((window_start, window_end))
+        if window_end >= end_dt:
+            return windows
+        window_start = window_end
+
+def iter_metric_chunks(fetch_window, windows, concurrency: int = None):
+    """
+    Calls `fetch_window(window_start, window_end)` for every window with at most `concurrency` requests
+    in flight and yields the results strictly in window order, as soon as each one (and all before it)
+    is available. Only `concurrency` results are ever held at once.
+    """
+    concurrency = max(1, concurrency or config.METRIC_FETCH_CONCURRENCY)
+    if len(windows) == 1:
+        yield fetch_window(*windows[0])
+        return
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="metric-chunk") as executor:
+        in_flight = collections.deque()
+        pending_windows = iter(windows)
+        for window in pending_windows:
+            in_flight.append(executor.submit(contextvars.copy_context().run, fetch_window, *window))
+            if len(in_flight) >= concurrency:
+                break
+        while in_flight:
+            result = in_flight.popleft().result()
+            next_window = next(pending_windows, None)
+            if next_window is not None:
+                in_flight.append(executor.submit(contextvars.copy_context().run, fetch_window, *next_window))
+            yield result
+
+def iter_deduplicated_chunks(chunks):
+    """
+    Passes MetricResult chunks through in order, dropping any point whose timestamp was already emitted
+    for the same series (the shared window boundaries). Error chunks are yielded unchanged.
+    """
+    last_timestamp = {}  # label -> last emitted epoch second
+    for chunk in chunks:
+        if not isinstance(chunk, compact_data.MetricResult):
+            yield chunk
+            continue
+        deduplicated_series = []
+        for series in chunk.series:
+            if series.label in last_timestamp:
+                series = series.after(last_timestamp[series.label])
+            if len(series):
+                last_timestamp[series.label] = series.timestamps[-1]
+            deduplicated_series.append(series)
+        yield chunk.with_series(deduplicated_series)
+
+def stitch_metric_chunks(chunks):
+    """Concatenates in-order chunks into one MetricResult; the first error chunk wins."""
+    stitched = None
+    for chunk in iter_deduplicated_chunks(chunks):
+        if not isinstance(chunk, compact_data.MetricResult):
+            return chunk
+        if stitched is None:
+            stitched = chunk.copy()
+            continue
+        for target, series in zip(stitched.series, chunk.series):
+            target.extend(series.timestamps, series.values)
+    return stitched if stitched is not None else compact_data.MetricResult([compact_data.MetricSeries("No data")], "No data")
+
+def _export_error(chunk):
+    return RuntimeError(f"Metric export aborted: {chunk.get('error') if isinstance(chunk, dict) else chunk}")
+
+def write_metric_chunks(chunks, destination, file_format: str = "csv") -> int:
+    """
+    Streams in-order metric chunks to `destination` (a path, or a binary file object for CSV) as
+    long-format rows (timestamp, label, value) without holding the full range in memory.
+    Parquet needs pyarrow. Returns the number of rows written; raises RuntimeError on an error chunk.
+    """
+    file_format = file_format.lower()
+    rows_written = 0
+    if file_format == "csv":
+        import io
+        owns_file = isinstance(destination, str)
+        binary_file = open(destination, "wb") if owns_file else destination
+        text_file = io.TextIOWrapper(binary_file, encoding="utf-8", newline="")
+        try:
+            writer = csv.writer(text_file)
+            writer.writerow(["timestamp", "label", "value"])
+            for chunk in iter_deduplicated_chunks(chunks):
+                if not isinstance(chunk, compact_data.MetricResult):
+                    raise _export_error(chunk)
+                for series in chunk.series:
+                    for ts, value in zip(series.iso_timestamps(), series.values_list()):
+                        writer.writerow([ts, series.label, value])
+                        rows_written += 1
+        finally:
+            text_file.flush()
+            text_file.detach()
+            if owns_file:
+                binary_file.close()
+        return rows_written
+    if file_format == "parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export requires the optional 'pyarrow' package (pip install -r requirements-parquet.txt).")
+        schema = pa.schema([("timestamp", pa.string()), ("label", pa.string()), ("value", pa.float64())])
+        with pq.ParquetWriter(destination, schema) as writer:
+            for chunk in iter_deduplicated_chunks(chunks):
+                if not isinstance(chunk, compact_data.MetricResult):
+                    raise _export_error(chunk)
+                for series in chunk.series:
+                    writer.write_table(pa.table({
+                        "timestamp": series.iso_timestamps(),
+                        "label": [series.label] * len(series),
+                        "value": series.values_list(),
+                    }, schema=schema))
+                    rows_written += len(series)
+        return rows_written
+    raise ValueError(f"Unsupported export format '{file_format}'. Use 'csv' or 'parquet'.")
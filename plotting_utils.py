@@ -1,26 +1,39 @@
 # plotting_utils.py
-import plotly.graph_objects as go
-import pandas as pd
 import datetime
 
+import compact_data
+
+# plotly and pandas are imported inside the functions that use them; they are only
+# needed once a plot or table is actually rendered.
+
+def _series_axes(series):
+    """Zero-copy numpy views of a MetricSeries: (UTC datetimes, values)."""
+    import numpy as np
+    import pandas as pd
+    timestamps = pd.to_datetime(np.frombuffer(series.timestamps, dtype=np.int64), unit="s", utc=True)
+    return timestamps, np.frombuffer(series.values, dtype=np.float64)
+
 def create_time_series_plot(metric_data_list):
+    import plotly.graph_objects as go
     fig = go.Figure()
     if not isinstance(metric_data_list, list):
         metric_data_list = [metric_data_list]
+    # Multi-statistic / metric-math results carry several series
+    series_list = [series for data in metric_data_list if isinstance(data, compact_data.MetricResult)
+                   for series in data.series]
 
-    for data in metric_data_list:
-        if data and data.get("Timestamps") and data.get("Values") and \
-           len(data["Timestamps"]) == len(data["Values"]):
+    for series in series_list:
+        if len(series):
             try:
-                timestamps = pd.to_datetime(data["Timestamps"])
+                timestamps, values = _series_axes(series)
                 fig.add_trace(go.Scatter(
                     x=timestamps,
-                    y=data["Values"],
+                    y=values,
                     mode='lines+markers',
-                    name=data.get("Label", "Metric")
+                    name=series.label or "Metric"
                 ))
             except Exception as e:
-                print(f"Error processing metric data for plotting: {e}. Data: {data}")
+                print(f"Error processing metric data for plotting: {e}. Series: {series.label}")
     
     fig.update_layout(
         title="Metrics Over Time",
@@ -31,46 +44,92 @@ def create_time_series_plot(metric_data_list):
     )
     return fig
 
-def create_table_from_logs(log_events_list):
-    if not log_events_list:
+def format_log_row(timestamp_ms, log_stream_name, message):
+    """One log event as a table row (Timestamp, Log Stream, Message)."""
+    try:
+        ts_utc = datetime.datetime.fromtimestamp(timestamp_ms / 1000.0, tz=datetime.timezone.utc)
+        formatted_ts = ts_utc.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3] + " UTC" 
+    except Exception as e:
+        print(f"Error processing log event for table: {e}. Timestamp: {timestamp_ms}")
+        formatted_ts = "ErrorParsingTimestamp"
+    return {"Timestamp": formatted_ts, "Log Stream": log_stream_name or 'N/A', "Message": message}
+
+def create_table_from_logs(log_batch):
+    """Table from a compact_data.LogBatch (or a list of event dicts), built column by column."""
+    import numpy as np
+    import pandas as pd
+    if not isinstance(log_batch, compact_data.LogBatch):
+        log_batch = compact_data.LogBatch(log_batch or [])
+    if not len(log_batch):
         return pd.DataFrame(columns=["Timestamp", "Log Stream", "Message"])
-        
-    processed_events = []
-    for event in log_events_list:
-        try:
-            ts_utc = datetime.datetime.fromtimestamp(event['timestamp'] / 1000.0, tz=datetime.timezone.utc)
-            formatted_ts = ts_utc.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3] + " UTC" 
-            
-            processed_events.append({
-                "Timestamp": formatted_ts,
-                "Log Stream": event.get('logStreamName', 'N/A'),
-                "Message": event.get('message', '')
-            })
-        except Exception as e:
-            print(f"Error processing log event for table: {e}. Event: {event}")
-            processed_events.append({
-                "Timestamp": "ErrorParsingTimestamp",
-                "Log Stream": event.get('logStreamName', 'N/A'),
-                "Message": f"Error processing: {event.get('message', '')} ({str(e)})"
-            })
-            
-    return pd.DataFrame(processed_events)
+    try:
+        timestamps = pd.to_datetime(np.frombuffer(log_batch.timestamps, dtype=np.int64), unit="ms", utc=True)
+        return pd.DataFrame({
+            "Timestamp": timestamps.strftime('%Y-%m-%d %H:%M:%S.%f').str[:-3] + " UTC",
+            # Stream names are stored once per batch; a categorical keeps it that way in the table
+            "Log Stream": pd.Categorical.from_codes(np.asarray(log_batch.stream_ids, dtype=np.int64), categories=log_batch.streams),
+            "Message": log_batch.messages,
+        })
+    except Exception as e:
+        print(f"Error creating table from log events: {e}")
+        return pd.DataFrame([format_log_row(log_batch.timestamps[i], log_batch.stream_name(i), log_batch.messages[i])
+                             for i in range(len(log_batch))])
+
+def create_table_from_log_rows(rows):
+    """Table from rows already formatted by `format_log_row` (e.g. a live-tail buffer)."""
+    import pandas as pd
+    return pd.DataFrame(list(rows), columns=["Timestamp", "Log Stream", "Message"])
 
 def create_table_from_metrics(metric_data):
-    if not metric_data or not metric_data.get("Timestamps") or not metric_data.get("Values") or \
-       len(metric_data["Timestamps"]) != len(metric_data["Values"]):
+    import pandas as pd
+    if not isinstance(metric_data, compact_data.MetricResult) or not metric_data.series:
+        return pd.DataFrame(columns=["Timestamp", "Value", "Metric"])
+    if metric_data.multi_series:
+        return _create_wide_table_from_metric_series(metric_data.series)
+    series = metric_data.series[0]
+    if not len(series):
         return pd.DataFrame(columns=["Timestamp", "Value", "Metric"])
 
     try:
-        timestamps_dt = pd.to_datetime(metric_data["Timestamps"])
-        formatted_timestamps = [ts.strftime('%Y-%m-%d %H:%M:%S %Z') if pd.notnull(ts) else 'N/A' for ts in timestamps_dt]
-
+        timestamps_dt, values = _series_axes(series)
         df = pd.DataFrame({
-            "Timestamp": formatted_timestamps,
-            "Value": metric_data["Values"],
+            "Timestamp": timestamps_dt.strftime('%Y-%m-%d %H:%M:%S %Z'),
+            "Value": values,
         })
-        df["Metric"] = metric_data.get("Label", "Value") 
+        df["Metric"] = series.label or "Value"
         return df
     except Exception as e:
-        print(f"Error creating table from metrics: {e}. Data: {metric_data}")
-        return pd.DataFrame({"Error": [str(e)]})
\ No newline at end of file
+        print(f"Error creating table from metrics: {e}. Series: {series.label}")
+        return pd.DataFrame({"Error": [str(e)]})
+
+def create_table_from_services(services_list):
+    import pandas as pd
+    return pd.DataFrame(services_list)
+
+def create_table_from_fleet_scan(scan_result):
+    import pandas as pd
+    top_services = scan_result.get("top_services") or []
+    if not top_services:
+        return pd.DataFrame(columns=["Rank", "Service", "Score", "Datapoints"])
+    return pd.DataFrame([
+        {"Rank": rank, "Service": entry["service_name"], "Score": entry["score"], "Datapoints": entry["datapoints"]}
+        for rank, entry in enumerate(top_services, start=1)
+    ])
+
+def _create_wide_table_from_metric_series(series_list):
+    """One row per timestamp, one column per series (statistic or expression)."""
+    import pandas as pd
+    try:
+        columns = {}
+        for series in series_list:
+            if len(series):
+                timestamps, values = _series_axes(series)
+                columns[series.label or "Value"] = pd.Series(values, index=timestamps)
+        if not columns:
+            return pd.DataFrame(columns=["Timestamp"])
+        df = pd.DataFrame(columns).sort_index()
+        df.index = df.index.strftime('%Y-%m-%d %H:%M:%S %Z')
+        return df.rename_axis("Timestamp").reset_index()
+    except Exception as e:
+        print(f"Error creating table from metric series: {e}. Series: {[series.label for series in series_list]}")
+        return pd.DataFrame({"Error": [str(e)]})
@@ -0,0 +1,79 @@
+# response_cache.py
+import collections
+import hashlib
+import json
+import re
+import threading
+import time
+
+import compact_data
+import config
+import telemetry
+
+
+def normalize_query(query: str) -> str:
+    """Lower-cases, collapses whitespace and drops trailing punctuation so trivially different phrasings share a key."""
+    return re.sub(r"\s+", " ", query or "").strip().lower().rstrip(" ?!.")
+
+def fingerprint(*parts) -> str:
+    """Stable SHA-256 over JSON-serialisable parts (dict keys are sorted, metric/log containers by their JSON shape)."""
+    payload = json.dumps(parts, sort_keys=True, default=compact_data.json_default, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire `ttl_seconds` after they were stored."""
+
+    def __init__(self, name: str, max_entries: int, ttl_seconds: float):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = collections.OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        telemetry.increment("sre_agent_response_cache_lookups_total", "Response cache lookups by cache and result.",
+                            cache=self.name, result="hit" if entry is not None else "miss")
+        return entry[1] if entry is not None else None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Two stages, mirroring the two LLM calls of a turn:
+#   decisions: (normalized query, recent history, data source) -> the LLM's tool-decision AIMessage
+#   summaries: (decision key, tool calls so far, hashes of their outputs) -> the LLM's next AIMessage
+#              (the final summary, or the next wave of tool calls of a multi-step turn)
+# A repeated question with unchanged tool output therefore skips every LLM round-trip.
+decisions = TTLCache("decision", config.RESPONSE_CACHE_MAX_ENTRIES, config.RESPONSE_CACHE_TTL_SECONDS)
+summaries = TTLCache("summary", config.RESPONSE_CACHE_MAX_ENTRIES, config.RESPONSE_CACHE_TTL_SECONDS)
+
+def decision_key(user_query: str, recent_user_queries: list, use_mock_data: bool) -> str:
+    return fingerprint("decision", normalize_query(user_query), [normalize_query(q) for q in recent_user_queries], use_mock_data)
+
+def summary_key(decision_cache_key: str, tool_calls: list, tool_outputs: list) -> str:
+    """`tool_calls` are the turn's (tool name, args) pairs so far, `tool_outputs` their outputs in the same order."""
+    return fingerprint("summary", decision_cache_key, tool_calls, [fingerprint(output) for output in tool_outputs])
+
+def clear():
+    decisions.clear()
+    summaries.clear()
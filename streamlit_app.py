@@ -2,12 +2,97 @@
 import streamlit as st
 import gemini_agent
 import plotting_utils 
-import pandas as pd
+import aws_utils
 import config 
 import json
+import contextlib
+import io
+import time
+import concurrent.futures
+import telemetry
+import deadline
+import metric_retrieval
+import log_index
+import log_tail
+import artifact_store
+import compact_data
 
 st.set_page_config(layout="wide", page_title="AIOps SRE AI Agent")
 
+@st.cache_resource(show_spinner=False)
+def warm_llm_client():
+    """Builds the Gemini client once per server process; every session reuses it."""
+    with telemetry.span("startup", "warm_llm_client"):
+        return gemini_agent.warm_up()
+
+@st.cache_resource(show_spinner=False)
+def warm_aws_clients():
+    """Creates the boto3 CloudWatch clients once per server process (only needed for real AWS calls)."""
+    with telemetry.span("startup", "warm_aws_clients"):
+        aws_utils.get_cloudwatch_client()
+        aws_utils.get_logs_client()
+        return True
+
+@st.cache_resource(show_spinner=False)
+def start_metrics_server():
+    return telemetry.start_metrics_server()
+
+start_metrics_server()
+
+@st.cache_resource(show_spinner=False)
+def agent_turn_executor():
+    return concurrent.futures.ThreadPoolExecutor(max_workers=16, thread_name_prefix="agent-turn")
+
+def run_agent_turn(prompt, use_mock_data, deadline_seconds, status_placeholder):
+    """
+    Runs the agent on a worker thread while this script thread keeps polling. Polling touches Streamlit,
+    so the Stop button (or a rerun) interrupts the wait; the turn is then cancelled and the agent stops
+    at its next checkpoint instead of running on unobserved.
+    """
+    turn_deadline = deadline.Deadline(deadline_seconds)
+    future = agent_turn_executor().submit(gemini_agent.get_langchain_direct_tool_call_response, prompt,
+                                          use_mock_data=use_mock_data, turn_deadline=turn_deadline,
+                                          session_log_index=st.session_state.log_index)
+    started = time.monotonic()
+    try:
+        while not future.done():
+            time.sleep(0.25)
+            status_placeholder.markdown(f"Thinking... 🧠 ({time.monotonic() - started:.0f}s)")
+        return future.result()
+    finally:
+        if not future.done():
+            turn_deadline.cancel()
+
+# st.fragment reruns only the live-tail panel on its timer; older Streamlit releases call it experimental_fragment.
+# Releases with neither get a plain function: the tail then only refreshes when the page reruns.
+def _plain_function(run_every=None):
+    return lambda func: func
+
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or _plain_function
+
+@_fragment(run_every=config.LOG_TAIL_POLL_SECONDS)
+def live_tail_panel():
+    tailer = st.session_state.get("log_tailer")
+    if tailer is None:
+        return
+    new_rows = tailer.poll()
+    st.subheader(f"📡 Live tail: {tailer.log_group_name}" + (f" (filter: `{tailer.filter_pattern}`)" if tailer.filter_pattern else ""))
+    status = f"{len(tailer.rows)} events buffered, {len(new_rows)} new in the last poll"
+    if tailer.dropped_events:
+        status += f", {tailer.dropped_events} older events dropped from the buffer"
+    st.caption(status)
+    if tailer.lagging:
+        st.warning(f"This log group produces more than {config.LOG_TAIL_MAX_EVENTS_PER_POLL} events per poll; the tail is catching up.")
+    if tailer.skipped_seconds:
+        st.warning(f"Skipped {tailer.skipped_seconds:.0f}s of events to keep up with the log group.")
+    if tailer.last_error:
+        st.error(f"Live tail poll failed: {tailer.last_error}")
+    with telemetry.span("render", "live_tail"):
+        st.dataframe(plotting_utils.create_table_from_log_rows(reversed(tailer.rows)), use_container_width=True, height=300)
+    if _fragment is _plain_function:
+        st.button("Refresh live tail", key="live_tail_refresh") # Any click reruns the page, which polls again
+    st.markdown("---")
+
 st.title("💬 AIOps SRE AI Agent")
 st.caption(f"Ask about AWS metrics, logs, workloads, or request remediations. Mock API")
 st.markdown("---")
@@ -15,6 +100,8 @@ st.markdown("---")
 if "messages" not in st.session_state:
     gemini_agent.clear_conversation_history() 
     st.session_state.messages = [{"role": "assistant", "content": "Hi! How can I help you with your AWS resources today?"}]
+if "log_index" not in st.session_state: # Log events this session fetched, for local drill-down
+    st.session_state.log_index = log_index.SessionLogIndex(config.LOG_INDEX_MAX_EVENTS)
 if "processing_query" not in st.session_state:
     st.session_state.processing_query = False
 if "user_prompt_for_processing" not in st.session_state:
@@ -27,7 +114,27 @@ with st.sidebar:
 
     if use_mock_data_source and config.MOCK_API_ENDPOINT == "YOUR_API_GATEWAY_INVOKE_URL_HERE":
         st.warning("Mock API Endpoint is not configured in `config.py`.")
+    turn_deadline_seconds = st.number_input("Response deadline (seconds)", min_value=5, max_value=300,
+                                            value=config.TURN_DEADLINE_SECONDS, step=5,
+                                            help="Maximum time for one answer. Slow backends are cut off and a partial answer is returned.")
     
+    st.markdown("---")
+    st.subheader("📡 Live Tail")
+    tail_target = st.text_input("Service or log group", value="ecs-service-X", key="tail_target")
+    tail_filter = st.text_input("Filter pattern", value="ERROR", key="tail_filter")
+    tail_start_col, tail_stop_col = st.columns(2)
+    if tail_start_col.button("Start tail", disabled=not tail_target):
+        tail_log_group = config.get_log_group_for_service(tail_target)
+        tail_uses_mock = use_mock_data_source
+        st.session_state.log_tailer = log_tail.LogTailer(
+            tail_log_group, tail_filter,
+            lambda start_ms, end_ms, limit: gemini_agent.fetch_log_events(tail_log_group, start_ms, end_ms, tail_filter,
+                                                                            limit, use_mock_data=tail_uses_mock),
+            overlap_seconds=0 if tail_uses_mock else None) # Mock events are generated on request, never ingested late
+    if tail_stop_col.button("Stop tail", disabled=st.session_state.get("log_tailer") is None):
+        st.session_state.log_tailer = None
+        st.rerun()
+
     st.markdown("---")
     st.subheader("Example Queries:")
     examples = [
@@ -46,95 +153,154 @@ with st.sidebar:
     st.markdown("---")
     if st.button("Clear Chat History & Context"):
         gemini_agent.clear_conversation_history() 
+        st.session_state.log_index.clear()
         st.session_state.messages = [{"role": "assistant", "content": "Hi! How can I help you with your AWS resources today? (History Cleared)"}]
         st.session_state.processing_query = False
         st.session_state.user_prompt_for_processing = None
         st.rerun()
 
+if st.session_state.get("log_tailer") is not None:
+    live_tail_panel()
+
+def _render_span(message, name):
+    """A render span for a message's first render only; reruns redraw history without re-counting it."""
+    if message.get("rendered"):
+        return contextlib.nullcontext()
+    return telemetry.span("render", name)
+
+def _display_fields(prompt, tool_used, data_ref, response_mode):
+    """How one tool result is shown: the message fields (plot/table/text) for the data behind `data_ref`."""
+    data_for_display = artifact_store.resolve(data_ref)
+    display = {}
+    if not data_for_display:
+        return display
+    display["raw_data_debug"] = data_ref
+    if isinstance(data_for_display, dict) and "error" in data_for_display:
+        print(f"Error from data source tool: {data_for_display['error']}")
+    elif tool_used == "GetAWSMetric":
+        user_wants_plot = any(kw in prompt.lower() for kw in ["plot", "graph", "chart", "visualize", "trend", "report"]) # Treat report as plot for now
+        user_wants_table = "table" in prompt.lower()
+        if user_wants_table and not user_wants_plot:
+            display["table_data"] = data_ref
+        else: 
+            display["plot_data"] = data_ref
+    elif tool_used == "GetAWSLogs":
+        display["table_data"] = data_ref
+    elif tool_used == "ScanFleetMetric":
+        display["table_data"] = data_ref
+    elif tool_used == "ListRunningServices" and "services_list" in data_for_display:
+        display["table_data"] = data_ref # Will be handled by table logic
+    elif tool_used in ["GetCloudWorkloadOverview", "GetClusterNodeCount"] and isinstance(data_for_display, dict) \
+            and response_mode != "template": # Templated answers already are the tool text
+        if data_for_display.get("overview_text"):
+            display["text_data_from_tool"] = data_for_display.get("overview_text")
+        elif data_for_display.get("services_text"):
+             display["text_data_from_tool"] = data_for_display.get("services_text")
+        elif data_for_display.get("node_count_text"):
+            display["text_data_from_tool"] = data_for_display.get("node_count_text")
+    return display
+
+def _render_display(message, display, key):
+    """Renders one tool result of an assistant message; `key` makes its widget keys unique."""
+    # Large tool results are artifact references; load them only to render this message.
+    plot_data = artifact_store.resolve(display.get("plot_data"))
+    table_data = artifact_store.resolve(display.get("table_data"))
+    if (display.get("plot_data") and plot_data is None) or (display.get("table_data") and table_data is None):
+        st.caption("The data for this answer has expired from the artifact store; ask again to refetch it.")
+    if plot_data:
+        try:
+            with _render_span(message, "plot"):
+                fig = plotting_utils.create_time_series_plot(plot_data)
+                st.plotly_chart(fig, use_container_width=True, key=f"plot_{key}")
+        except Exception as e_plot:
+            st.error(f"Streamlit: Error trying to plot data: {e_plot}")
+    
+    if table_data:
+        try:
+            with _render_span(message, "table"):
+                df_display = None
+                if isinstance(table_data, compact_data.LogBatch):
+                     df_display = plotting_utils.create_table_from_logs(table_data)
+                elif isinstance(table_data, compact_data.MetricResult):
+                     df_display = plotting_utils.create_table_from_metrics(table_data)
+                elif isinstance(table_data, dict) and "services_list" in table_data:
+                    df_display = plotting_utils.create_table_from_services(table_data["services_list"])
+                elif isinstance(table_data, dict) and "top_services" in table_data:
+                    df_display = plotting_utils.create_table_from_fleet_scan(table_data)
+            
+                if df_display is not None and not df_display.empty:
+                    st.dataframe(df_display, use_container_width=True, key=f"table_{key}")
+                elif df_display is not None: 
+                     pass 
+        except Exception as e_table:
+            st.error(f"Streamlit: Error trying to display table: {e_table}")
+
+    metric_payload = plot_data or table_data
+    if isinstance(metric_payload, compact_data.MetricResult):
+        # The CSV is written only on request (not on every rerun). Large ones are kept in the artifact store,
+        # so the message holds a reference; if that expires the button is offered again.
+        csv_export = artifact_store.resolve(display.get("csv_export"))
+        if csv_export is None and st.button("Prepare metric data download (CSV)", key=f"prepare_csv_{key}"):
+            csv_buffer = io.BytesIO()
+            metric_retrieval.write_metric_chunks([metric_payload], csv_buffer, "csv")
+            csv_export = csv_buffer.getvalue().decode("utf-8")
+            display["csv_export"] = artifact_store.offload(csv_export)
+        if csv_export is not None:
+            st.download_button("Download metric data (CSV)", csv_export, file_name="metric_data.csv",
+                               mime="text/csv", key=f"download_{key}")
+
+    # Display simple text data from new tools if not handled by table/plot
+    if display.get("text_data_from_tool"):
+        st.markdown(f"**Tool Output:**\n```\n{display['text_data_from_tool']}\n```", unsafe_allow_html=True)
+
+    if display.get("raw_data_debug"): # Keep for debugging if needed
+         with st.expander("View Tool's Raw Data (Debug)"):
+            st.json(compact_data.to_jsonable(artifact_store.resolve(display["raw_data_debug"])))
+
 for message_idx, message in enumerate(st.session_state.messages):
     with st.chat_message(message["role"]):
         st.markdown(message["content"]) 
         if message["role"] == "assistant":
-            if message.get("plot_data"):
-                try:
-                    fig = plotting_utils.create_time_series_plot(message["plot_data"])
-                    st.plotly_chart(fig, use_container_width=True, key=f"plot_{message_idx}")
-                except Exception as e_plot:
-                    st.error(f"Streamlit: Error trying to plot data: {e_plot}")
-            
-            if message.get("table_data"):
-                try:
-                    df_display = None
-                    if isinstance(message["table_data"], dict) and "events" in message["table_data"]:
-                         df_display = plotting_utils.create_table_from_logs(message["table_data"]["events"])
-                    elif isinstance(message["table_data"], dict) and "Timestamps" in message["table_data"]:
-                         df_display = plotting_utils.create_table_from_metrics(message["table_data"])
-                    elif isinstance(message["table_data"], dict) and "services_list" in message["table_data"]:
-                        df_display = pd.DataFrame(message["table_data"]["services_list"])
-                    
-                    if df_display is not None and not df_display.empty:
-                        st.dataframe(df_display, use_container_width=True, key=f"table_{message_idx}")
-                    elif df_display is not None: 
-                         pass 
-                except Exception as e_table:
-                    st.error(f"Streamlit: Error trying to display table: {e_table}")
+            if message.get("agent_steps"):
+                st.caption("Steps: " + " → ".join(
+                    f"{step['tool']}" + (" (reused)" if step["reused"] else "") for step in message["agent_steps"]))
+            if message.get("correlation_id") and not message.get("rendered"):
+                telemetry.bind_correlation_id(message["correlation_id"])
+            # One entry per tool result of the turn (e.g. CPU and memory of a multi-tool answer)
+            for display_idx, display in enumerate(message.get("displays") or []):
+                _render_display(message, display, f"{message_idx}_{display_idx}")
 
             if message.get("script_suggestion"):
                 st.code(message["script_suggestion"], language="bash")
-            
-            # Display simple text data from new tools if not handled by table/plot
-            if message.get("text_data_from_tool"):
-                st.markdown(f"**Tool Output:**\n```\n{message['text_data_from_tool']}\n```", unsafe_allow_html=True)
-
-
-            if message.get("raw_data_debug"): # Keep for debugging if needed
-                 with st.expander("View Tool's Raw Data (Debug)"):
-                    st.json(message["raw_data_debug"])
+        message["rendered"] = True
 
 if st.session_state.processing_query and st.session_state.user_prompt_for_processing:
     prompt_to_process = st.session_state.user_prompt_for_processing
     
     with st.chat_message("assistant"):
-        st.markdown("Thinking... 🧠")
+        thinking_placeholder = st.empty()
+        thinking_placeholder.markdown("Thinking... 🧠")
         
     try:
-        response_package = gemini_agent.get_langchain_direct_tool_call_response(
-            prompt_to_process, 
-            use_mock_data=use_mock_data_source
-        )
+        response_package = run_agent_turn(prompt_to_process, use_mock_data_source,
+                                          turn_deadline_seconds, thinking_placeholder)
         
         assistant_response_text = response_package.get("text_summary", "Sorry, I didn't get a response.")
-        data_for_display = response_package.get("data_for_display")
-        tool_used = response_package.get("tool_used")
         script_suggestion = response_package.get("script_suggestion")
 
-        assistant_message_payload = {"role": "assistant", "content": assistant_response_text}
-
-        if data_for_display:
-            assistant_message_payload["raw_data_debug"] = data_for_display 
-            if isinstance(data_for_display, dict) and "error" in data_for_display:
-                print(f"Error from data source tool: {data_for_display['error']}")
-            elif tool_used == "GetAWSMetric":
-                user_wants_plot = any(kw in prompt_to_process.lower() for kw in ["plot", "graph", "chart", "visualize", "trend", "report"]) # Treat report as plot for now
-                user_wants_table = "table" in prompt_to_process.lower()
-                if user_wants_table and not user_wants_plot:
-                    assistant_message_payload["table_data"] = data_for_display
-                else: 
-                    assistant_message_payload["plot_data"] = data_for_display
-            elif tool_used == "GetAWSLogs":
-                assistant_message_payload["table_data"] = data_for_display
-            elif tool_used == "ListRunningServices" and "services_list" in data_for_display:
-                assistant_message_payload["table_data"] = data_for_display # Will be handled by table logic
-            elif tool_used in ["GetCloudWorkloadOverview", "GetClusterNodeCount"] and isinstance(data_for_display, dict):
-                if data_for_display.get("overview_text"):
-                    assistant_message_payload["text_data_from_tool"] = data_for_display.get("overview_text")
-                elif data_for_display.get("services_text"):
-                     assistant_message_payload["text_data_from_tool"] = data_for_display.get("services_text")
-                elif data_for_display.get("node_count_text"):
-                    assistant_message_payload["text_data_from_tool"] = data_for_display.get("node_count_text")
+        assistant_message_payload = {"role": "assistant", "content": assistant_response_text,
+                                     "correlation_id": response_package.get("correlation_id")}
+
+        # "data_for_display" entries are ArtifactRefs for large results
+        displays = [_display_fields(prompt_to_process, item["tool_used"], item["data_for_display"],
+                                    response_package.get("response_mode"))
+                    for item in response_package.get("displays") or []]
+        assistant_message_payload["displays"] = [display for display in displays if display]
         
         if script_suggestion:
             assistant_message_payload["script_suggestion"] = script_suggestion
+        if len(response_package.get("agent_steps") or []) > 1: # Only multi-step answers show their tool chain
+            assistant_message_payload["agent_steps"] = response_package["agent_steps"]
         
         st.session_state.messages.append(assistant_message_payload)
 
@@ -155,4 +321,10 @@ if user_prompt_input and not st.session_state.processing_query:
     st.session_state.messages.append({"role": "user", "content": user_prompt_input})
     st.session_state.user_prompt_for_processing = user_prompt_input
     st.session_state.processing_query = True
-    st.rerun() 
+    st.rerun()
+
+# Warm the per-process clients after the page has rendered, so the first query doesn't pay for them
+# and the initial page load isn't blocked either.
+warm_llm_client()
+if not use_mock_data_source:
+    warm_aws_clients()
@@ -0,0 +1,261 @@
+# telemetry.py
+import contextvars
+import functools
+import json
+import threading
+import time
+import uuid
+
+import config
+
+# Correlation ID for the current user turn. Context variables follow the
+# logical flow of a turn, so every span opened while answering one query
+# carries the same ID.
+_correlation_id = contextvars.ContextVar("sre_agent_correlation_id", default=None)
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def new_correlation_id():
+    correlation_id = uuid.uuid4().hex[:16]
+    _correlation_id.set(correlation_id)
+    return correlation_id
+
+def get_correlation_id():
+    return _correlation_id.get()
+
+def bind_correlation_id(correlation_id):
+    """Makes an existing correlation ID current (e.g. when re-rendering a past turn)."""
+    _correlation_id.set(correlation_id)
+
+
+class Counter:
+    __slots__ = ("name", "help_text", "_values", "_lock")
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0.0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, val in items:
+            lines.append(f"{self.name}{_format_labels(key)} {_format_number(val)}")
+        return lines
+
+
+class Histogram:
+    __slots__ = ("name", "help_text", "buckets", "_series", "_lock")
+
+    def __init__(self, name, help_text, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label key -> [bucket_counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [[0] * len(self.buckets), 0.0, 0]
+                self._series[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        series = self._series.get(tuple(sorted(labels.items())))
+        return series[2] if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(key, list(s[0]), s[1], s[2]) for key, s in self._series.items()]
+        for key, bucket_counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', _format_number(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_number(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(val)}"' for name, val in key) + "}"
+
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_number(value):
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+_registry_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+
+def counter(name, help_text=""):
+    """Returns the process-wide counter called `name`, creating it on first use."""
+    with _registry_lock:
+        if name not in _counters:
+            _counters[name] = Counter(name, help_text)
+        return _counters[name]
+
+def histogram(name, help_text="", buckets=DEFAULT_LATENCY_BUCKETS):
+    """Returns the process-wide histogram called `name`, creating it on first use."""
+    with _registry_lock:
+        if name not in _histograms:
+            _histograms[name] = Histogram(name, help_text, buckets)
+        return _histograms[name]
+
+def render_prometheus():
+    """Renders every registered metric in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_counters.values()) + list(_histograms.values())
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+SPAN_DURATION = histogram("sre_agent_span_duration_seconds", "Duration of instrumented operations.")
+SPAN_TOTAL = counter("sre_agent_spans_total", "Instrumented operations by kind, name and status.")
+
+
+class Span:
+    __slots__ = ("kind", "name", "attrs", "status", "_start")
+
+    def __init__(self, kind, name, attrs):
+        self.kind = kind
+        self.name = name
+        self.attrs = attrs
+        self.status = "ok"
+        self._start = 0.0
+
+    def set_attr(self, key, value):
+        self.attrs[key] = value
+
+    def set_status(self, status):
+        self.status = status
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        if exc_type is not None:
+            self.status = "error"
+            self.attrs.setdefault("error", f"{exc_type.__name__}: {exc}")
+        SPAN_DURATION.observe(duration, kind=self.kind, name=self.name)
+        SPAN_TOTAL.inc(kind=self.kind, name=self.name, status=self.status)
+        if config.TELEMETRY_JSON_LOGS:
+            log_event("span", kind=self.kind, name=self.name, status=self.status,
+                      duration_ms=round(duration * 1000, 3), **self.attrs)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set_attr(self, key, value):
+        pass
+
+    def set_status(self, status):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+
+def span(kind, name, **attrs):
+    """
+    Times a block of work and records it under (kind, name).
+    Usage: `with telemetry.span("tool", "GetAWSMetric") as sp: ...`
+    When telemetry is disabled this returns a shared no-op object, so hot paths pay almost nothing.
+    """
+    if not config.TELEMETRY_ENABLED:
+        return _NOOP_SPAN
+    return Span(kind, name, attrs)
+
+def traced(kind, name=None):
+    """Decorator form of `span`; the span name defaults to the function name."""
+    def decorator(func):
+        span_name = name or func.__name__
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(kind, span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def increment(name, help_text="", amount=1.0, **labels):
+    if config.TELEMETRY_ENABLED:
+        counter(name, help_text).inc(amount, **labels)
+
+def log_event(event, **fields):
+    """Emits one structured JSON log line tagged with the current correlation ID."""
+    record = {"ts": time.time(), "event": event, "correlation_id": _correlation_id.get()}
+    record.update(fields)
+    print(json.dumps(record, default=str), flush=True)
+
+
+_metrics_server = None
+
+def start_metrics_server(port=None, host=None):
+    """Serves `render_prometheus()` on /metrics from a daemon thread. Safe to call repeatedly."""
+    global _metrics_server
+    port = port if port is not None else config.TELEMETRY_METRICS_PORT
+    host = host if host is not None else config.TELEMETRY_METRICS_HOST
+    if _metrics_server is not None or not port:
+        return _metrics_server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        _metrics_server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+    except OSError as e:
+        print(f"TELEMETRY: Could not start metrics server on port {port}: {e}")
+        return None
+    threading.Thread(target=_metrics_server.serve_forever, name="sre-agent-metrics", daemon=True).start()
+    print(f"TELEMETRY: Prometheus metrics available on {host}:{port}/metrics")
+    return _metrics_server
@@ -0,0 +1,46 @@
+# tool_schemas.py
+# Pydantic argument schemas for the agent's tools. Kept separate from gemini_agent so that
+# langchain_core (and pydantic) are only imported once the LLM is actually being built.
+
+from typing import List
+
+from langchain_core.pydantic_v1 import BaseModel, Field
+
+class GetAWSMetricToolInput(BaseModel):
+    service_name: str = Field(description="The name or ID of the AWS service/resource (e.g., 'ec2-instance-A'). REQUIRED.")
+    metric_name: str = Field(description="The name of the metric (e.g., 'CPUUtilization', 'MemoryUtilization'). REQUIRED.")
+    time_range_str: str = Field(default="last hour", description="Natural language time duration for the metric data (e.g., 'last 3 hours'). Defaults to 'last hour'.")
+    statistic: str = Field(default="Average", description="The statistic to retrieve (e.g., 'Average', 'Sum'). Defaults to 'Average'.")
+    period_seconds: int = Field(default=0, description="Granularity in seconds (e.g., 60, 300). Defaults to auto-calculated (0 means auto).")
+    statistics: List[str] = Field(default_factory=list, description="Optional list of statistics to fetch together in one call, e.g. ['Average', 'Maximum', 'p99']. Percentiles use the form 'pNN'. Overrides 'statistic'.")
+    expressions: List[str] = Field(default_factory=list, description="Optional metric-math expressions evaluated server-side, as 'Label=expression'. Reference metrics by name, optionally with a statistic suffix, e.g. 'ErrorRate=100*Errors_Sum/Invocations_Sum'. Only + - * / and parentheses.")
+
+class GetAWSLogsToolInput(BaseModel):
+    service_or_log_group_name: str = Field(description="Service name (e.g., 'ecs-service-X') or full CloudWatch Log Group name. REQUIRED.")
+    time_range_str: str = Field(default="last hour", description="Natural language time duration for logs. Defaults to 'last hour'.")
+    filter_pattern: str = Field(default="", description="CloudWatch Logs filter pattern (e.g., 'ERROR'). Optional.")
+    limit: int = Field(default=50, description="Maximum number of log events. Defaults to 50.")
+
+class SuggestScalingActionToolInput(BaseModel):
+    service_name: str = Field(description="Name of the AWS service experiencing high load. REQUIRED.")
+    service_type: str = Field(description="Type of the AWS service (e.g., 'ECS Service', 'EC2 AutoScalingGroup'). REQUIRED.")
+    metric_name: str = Field(description="Name of the metric that is high (e.g., 'CPUUtilization'). REQUIRED.")
+    current_metric_value: str = Field(description="Current high metric value (e.g., '90%', '85'). REQUIRED.")
+
+class GetCloudWorkloadOverviewToolInput(BaseModel):
+    filter_criteria: str = Field(default="", description="Optional filter criteria like environment (e.g., 'production') or application name if known by user.")
+
+class ListRunningServicesToolInput(BaseModel):
+    service_type_filter: str = Field(default="", description="Optional filter for service type (e.g., 'Lambda', 'ECS', 'EC2'). If empty, attempts to list key services or asks for clarification.")
+    application_tag_or_prefix: str = Field(default="", description="Optional tag or naming prefix to filter services, especially useful for Lambda apps.")
+
+class GetClusterNodeCountToolInput(BaseModel):
+    cluster_or_asg_name: str = Field(default="", description="The name of the ECS cluster, EKS cluster, or EC2 Auto Scaling Group. Give it if the user implies a specific cluster; leave it empty otherwise and the tool asks for it.")
+
+class ScanFleetMetricToolInput(BaseModel):
+    metric_name: str = Field(description="The metric to compare across all services (e.g., 'CPUUtilization'). REQUIRED.")
+    time_range_str: str = Field(default="last hour", description="Natural language time duration (e.g., 'last 15 minutes'). Defaults to 'last hour'.")
+    statistic: str = Field(default="Average", description="CloudWatch statistic per datapoint (e.g., 'Average', 'Maximum'). Defaults to 'Average'.")
+    score: str = Field(default="average", description="How each service's series is reduced to one score: 'average', 'max', 'latest' or 'p95'. Defaults to 'average'.")
+    top_k: int = Field(default=5, description="How many of the highest-scoring services to return. Defaults to 5.")
+    service_type_filter: str = Field(default="", description="Optional service type to restrict the scan to (e.g., 'EC2', 'Lambda').")